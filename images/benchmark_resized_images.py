@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark the image derivative pipeline in generate_resized_images.py
+
+Generates synthetic fixtures locally, runs the pipeline under different
+worker counts and resampling filters, and reports images/sec, bytes out,
+peak RSS and per-stage timings as JSON, so runs can be compared commit to
+commit.
+"""
+# /// script
+# dependencies = [
+#   "pillow",
+# ]
+# ///
+
+from PIL import Image
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import PIL
+
+import generate_resized_images as pipeline
+
+# Fixtures: (name, size, mode, format). Only JPEGs are picked up by the
+# pipeline; the PNGs exercise the alpha/palette paths in the stage timings.
+FIXTURES = [
+    ('small-rgb.jpg', (1600, 1067), 'RGB', 'JPEG'),
+    ('camera-rgb.jpg', (6000, 4000), 'RGB', 'JPEG'),
+    ('portrait-rgb.jpg', (3000, 4500), 'RGB', 'JPEG'),
+    ('grey.jpg', (4000, 3000), 'L', 'JPEG'),
+    ('print-cmyk.jpg', (3000, 2000), 'CMYK', 'JPEG'),
+    ('alpha-rgba.png', (2400, 1600), 'RGBA', 'PNG'),
+    ('palette.png', (2400, 1600), 'P', 'PNG'),
+]
+
+DEFAULT_JOBS = sorted({1, 2, os.cpu_count() or 1})
+DEFAULT_FILTERS = ['lanczos', 'bicubic', 'bilinear']
+
+
+def make_fixture(path, size, mode, fmt):
+    """Write a synthetic photo-like image: gradients plus noise, so it
+    compresses like a real photo rather than a flat test card"""
+    width, height = size
+    noise = Image.effect_noise(size, 40)
+    horizontal = Image.linear_gradient('L').rotate(90).resize(size)
+    vertical = Image.linear_gradient('L').resize(size)
+    bands = [
+        Image.blend(horizontal, noise, 0.3),
+        Image.blend(vertical, noise, 0.3),
+        Image.blend(horizontal.transpose(Image.Transpose.FLIP_LEFT_RIGHT), noise, 0.3),
+    ]
+    img = Image.merge('RGB', bands)
+
+    if mode == 'RGBA':
+        img.putalpha(vertical)
+    elif mode == 'P':
+        img = img.quantize(64)
+    elif mode != 'RGB':
+        img = img.convert(mode)
+
+    img.save(path, fmt, **({'quality': 92} if fmt == 'JPEG' else {}))
+
+
+def make_fixtures(fixture_dir, scale=1.0):
+    """Create every fixture (scaled) in fixture_dir; returns their descriptions"""
+    os.makedirs(fixture_dir, exist_ok=True)
+    fixtures = []
+    for name, size, mode, fmt in FIXTURES:
+        size = (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+        path = os.path.join(fixture_dir, name)
+        make_fixture(path, size, mode, fmt)
+        fixtures.append({'name': name, 'size': list(size), 'mode': mode, 'format': fmt,
+                         'bytes': os.path.getsize(path)})
+    return fixtures
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its (finished) children"""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def output_bytes(source_dir):
+    """Total size of the derivatives written into source_dir"""
+    total = 0
+    for entry in os.scandir(source_dir):
+        if entry.is_dir():
+            total += sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+    return total
+
+
+def run_scenario(fixture_dir, jobs, resample, formats, widths):
+    """Run the pipeline once on a fresh copy of the JPEG fixtures
+
+    Called in its own process (see --scenario) so peak RSS is per scenario.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in os.listdir(fixture_dir):
+            if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg'):
+                shutil.copy(os.path.join(fixture_dir, name), work_dir)
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = pipeline.process_images(work_dir, jobs=jobs, formats=formats, widths=widths,
+                                              resample=resample)
+        seconds = time.perf_counter() - started
+
+        return {
+            'jobs': jobs,
+            'resample': resample,
+            'images': summary['total'],
+            'failed': summary['failed'],
+            'seconds': round(seconds, 3),
+            'images_per_sec': round(summary['total'] / seconds, 2),
+            'bytes_out': output_bytes(work_dir),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'timings': {stage: round(value, 3) for stage, value in summary['timings'].items()},
+        }
+
+
+def run_stages(fixture_dir, formats, widths):
+    """Time each pipeline stage for every fixture, in-process and single-threaded"""
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, _, _, _ in FIXTURES:
+            stem = os.path.splitext(name)[0]
+            path = os.path.join(fixture_dir, name)
+            with Image.open(path) as img:
+                ladder = pipeline.source_ladder(widths, img.width)
+            outputs = [(os.path.join(work_dir, f"{stem}-medium-{fmt}"), pipeline.MEDIUM_SIZE, fmt)
+                       for fmt in formats]
+            outputs += [(os.path.join(work_dir, f"{stem}-thumb-{fmt}"), pipeline.THUMB_SIZE, fmt)
+                        for fmt in formats]
+            outputs += [(os.path.join(work_dir, f"{stem}-{width}-{fmt}"), pipeline.ladder_size(width), fmt)
+                        for width in ladder for fmt in formats]
+            stats = {}
+            error = pipeline.generate_derivatives(path, outputs, stats=stats)
+            results.append({
+                'fixture': name,
+                'error': error,
+                'timings': {stage: round(value, 4) for stage, value in stats['timings'].items()},
+            })
+    return results
+
+
+def git_commit():
+    """Current commit of the repository, if available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark generate_resized_images.py")
+    parser.add_argument("--jobs", default=",".join(str(jobs) for jobs in DEFAULT_JOBS),
+                        help="Comma-separated worker counts to run (default: %(default)s)")
+    parser.add_argument("--filters", default=",".join(DEFAULT_FILTERS),
+                        help="Comma-separated resampling filters to run (default: %(default)s)")
+    parser.add_argument("--formats", default="jpeg",
+                        help="Comma-separated output formats (default: jpeg)")
+    parser.add_argument("--widths", default=",".join(str(width) for width in pipeline.WIDTHS),
+                        help="Comma-separated srcset ladder widths, or 'none'")
+    parser.add_argument("--copies", type=int, default=4,
+                        help="Copies of each JPEG fixture per run, to give the workers enough to do "
+                             "(default: 4)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Scale factor for fixture dimensions, e.g. 0.25 for a quick run")
+    parser.add_argument("-o", "--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    args.jobs = [int(jobs) for jobs in args.jobs.split(',') if jobs.strip()]
+    args.filters = [name.strip() for name in args.filters.split(',') if name.strip()]
+    for name in args.filters:
+        if name not in pipeline.RESAMPLE_FILTERS:
+            parser.error(f"unknown filter '{name}' (choose from {', '.join(pipeline.RESAMPLE_FILTERS)})")
+    args.formats = ['jpeg'] + [fmt.strip() for fmt in args.formats.split(',')
+                               if fmt.strip() and fmt.strip() != 'jpeg']
+    for fmt in args.formats:
+        if fmt not in pipeline.available_formats():
+            parser.error(f"format '{fmt}' is not available in this Pillow build")
+    if args.widths.strip().lower() == 'none':
+        args.widths = []
+    else:
+        args.widths = [int(width) for width in args.widths.split(',') if width.strip()]
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.scenario:
+        # Child process: run one scenario and print its result
+        scenario = json.loads(args.scenario)
+        print(json.dumps(run_scenario(**scenario)))
+        return
+
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        print(f"Generating fixtures in {fixture_dir}...", file=sys.stderr)
+        fixtures = make_fixtures(fixture_dir, args.scale)
+        for name in os.listdir(fixture_dir):
+            stem, extension = os.path.splitext(name)
+            if extension == '.jpg':
+                for copy in range(1, args.copies):
+                    shutil.copy(os.path.join(fixture_dir, name), os.path.join(fixture_dir, f"{stem}-{copy}{extension}"))
+
+        scenarios = []
+        for resample in args.filters:
+            for jobs in args.jobs:
+                print(f"Running jobs={jobs} resample={resample}...", file=sys.stderr)
+                scenario = {'fixture_dir': fixture_dir, 'jobs': jobs, 'resample': resample,
+                            'formats': args.formats, 'widths': args.widths}
+                result = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario', json.dumps(scenario)],
+                                        capture_output=True, text=True, check=True)
+                scenarios.append(json.loads(result.stdout))
+
+        print(f"Timing stages per fixture...", file=sys.stderr)
+        stages = run_stages(fixture_dir, args.formats, args.widths)
+
+    report = {
+        'commit': git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'settings': {'formats': args.formats, 'widths': args.widths, 'copies': args.copies, 'scale': args.scale},
+        'fixtures': fixtures,
+        'scenarios': scenarios,
+        'stages': stages,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,45 @@
 Gallery Generator Script
 Generates photo gallery index pages and master gallery page based on gallery-config.md
 """
-
+# /// script
+# dependencies = [
+#   "pillow",
+# ]
+# ///
+
+import argparse
+import json
 import os
 import re
+import sys
 from pathlib import Path
 from typing import Dict, List, Tuple
 
+from PIL import Image
+
+from generate_resized_images import FORMATS, load_manifest
+
+# Per-gallery cache of image dimensions and capture times
+METADATA_NAME = '.metadata.json'
+METADATA_VERSION = 1
+
+# EXIF tags read from image headers
+EXIF_IFD = 0x8769
+EXIF_DATETIME = 0x0132
+EXIF_DATETIME_ORIGINAL = 0x9003
+
+# Modern derivative formats, in browser preference order, with their MIME types
+MODERN_FORMATS = [('avif', 'image/avif'), ('webp', 'image/webp')]
+
+# Justified row heights (desktop, and at or below MOBILE_BREAKPOINT); a
+# thumbnail's srcset sizes hint is its aspect ratio times these
+ROW_HEIGHT = 260
+MOBILE_ROW_HEIGHT = 140
+MOBILE_BREAKPOINT = 768
+
+# srcset sizes hint matching the lightbox CSS
+LIGHTBOX_SIZES = '90vw'
+
 
 class GalleryConfig:
     """Parse and store gallery configuration"""
@@ -84,20 +117,135 @@ class GalleryGenerator:
 
         return sorted(images)
 
+    def read_image_metadata(self, path: Path) -> Dict:
+        """Read dimensions and capture time from an image's header and EXIF
+
+        Only the header is parsed; the pixel data is never decoded. The
+        stored (unrotated) dimensions are used, matching the derivatives,
+        which are written without EXIF orientation.
+        """
+        with Image.open(path) as img:
+            width, height = img.size
+            exif = img.getexif()
+            taken = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+
+        # EXIF dates are 'YYYY:MM:DD HH:MM:SS', which sorts correctly as text
+        taken = str(taken).strip('\x00 ') if taken else ''
+        return {'width': width, 'height': height, 'taken': taken or None}
+
+    def get_image_metadata(self, directory: str) -> List[Dict]:
+        """Get dimensions and capture time of every image, sorted by capture time
+
+        Results are cached in the gallery's metadata index and only re-read
+        for files whose size or mtime changed. Each entry also carries the
+        blurhash placeholder and srcset ladder generate_resized_images.py
+        recorded in the derivatives manifest, if any. Images without a
+        capture time sort after the rest, by filename.
+        """
+        gallery_path = self.base_path / directory
+        manifest = load_manifest(str(gallery_path))
+        index_path = gallery_path / METADATA_NAME
+
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            if index.get('version') != METADATA_VERSION:
+                index = None
+        except (OSError, ValueError):
+            index = None
+        cached = index['files'] if index else {}
+
+        files = {}
+        for filename in self.get_image_files(directory):
+            stat = (gallery_path / filename).stat()
+            entry = cached.get(filename)
+            if not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                try:
+                    entry = self.read_image_metadata(gallery_path / filename)
+                except Exception as e:
+                    print(f"Warning: Could not read {filename}: {e}")
+                    continue
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            derived = manifest['files'].get(filename, {})
+            files[filename] = dict(entry, placeholder=derived.get('placeholder'),
+                                   ladder=self.get_derivative_ladder(filename, derived))
+
+        if files != cached:
+            with open(index_path, 'w') as f:
+                json.dump({'version': METADATA_VERSION, 'files': files}, f, indent=2, sort_keys=True)
+
+        images = [dict(entry, file=filename) for filename, entry in files.items()]
+        images.sort(key=lambda image: (image['taken'] is None, image['taken'] or '', image['file']))
+        return images
+
+    def get_derivative_dirs_and_extensions(self, directory: str) -> Tuple[set, set]:
+        """Get the output directories and extensions every image has derivatives in
+
+        Read from the gallery's derivatives manifest (written by
+        generate_resized_images.py), so only outputs that were actually
+        generated for the whole gallery are offered.
+        """
+        manifest = load_manifest(str(self.base_path / directory))
+        dirs, extensions = None, None
+        for entry in manifest['files'].values():
+            outputs = entry.get('outputs', {})
+            entry_dirs = {os.path.dirname(output) for output in outputs}
+            entry_extensions = {os.path.splitext(output)[1].lower() for output in outputs}
+            dirs = entry_dirs if dirs is None else dirs & entry_dirs
+            extensions = entry_extensions if extensions is None else extensions & entry_extensions
+
+        return dirs or set(), extensions or set()
+
+    def get_derivative_formats(self, directory: str) -> List[str]:
+        """Get the modern formats generate_resized_images.py wrote for a gallery
+
+        Returned in browser preference order.
+        """
+        _, extensions = self.get_derivative_dirs_and_extensions(directory)
+        return [fmt for fmt, _ in MODERN_FORMATS if FORMATS[fmt][0] in extensions]
+
+    def get_derivative_ladder(self, filename: str, entry: Dict) -> List[List[int]]:
+        """Get an image's srcset ladder from its derivatives manifest entry
+
+        Returns [directory width, pixel width] pairs, smallest first. Ladder
+        outputs are never upscaled, so a small source has fewer widths (the
+        last at its own width) and the srcset must use the real ones.
+        """
+        ladder = []
+        for output, record in entry.get('outputs', {}).items():
+            output_dir, output_file = os.path.split(output)
+            match = re.fullmatch(r'w(\d+)', output_dir)
+            if match and output_file == filename:
+                dir_width = int(match.group(1))
+                ladder.append([dir_width, record.get('width', dir_width)])
+        return sorted(ladder)
+
     def generate_gallery_page(self, gallery: Dict[str, str]) -> str:
         """Generate individual gallery index.html"""
         directory = gallery['directory']
         title = gallery['title']
         year = gallery['year']
 
-        images = self.get_image_files(directory)
+        images = self.get_image_metadata(directory)
 
         if not images:
             print(f"Warning: No images found in {directory}")
             return ""
 
-        # Generate JavaScript array of image filenames
-        image_list = ',\n            '.join([f"'{img}'" for img in images])
+        # Generate JavaScript array of images, with dimensions for the layout
+        # and a blurhash placeholder to show until the thumbnail arrives
+        image_list = ',\n            '.join([
+            f"{{ file: '{img['file']}', width: {img['width']}, height: {img['height']}, "
+            f"placeholder: {json.dumps(img['placeholder'])}, ladder: {json.dumps(img['ladder'])} }}"
+            for img in images
+        ])
+
+        # Modern formats are served through <picture>, with the JPEG as fallback
+        formats = self.get_derivative_formats(directory)
+        mime_types = dict(MODERN_FORMATS)
+        format_list = ', '.join(
+            f"{{ ext: '{FORMATS[fmt][0]}', type: '{mime_types[fmt]}' }}" for fmt in formats
+        )
 
         # Extract base name for CDN URL
         cdn_base = f"https://cdn.mulvany.net/{directory}/"
@@ -153,22 +301,38 @@ class GalleryGenerator:
             box-shadow: 0 6px 25px rgba(255, 255, 255, 0.2);
         }}
 
+        /* Justified rows: each item grows in proportion to its aspect ratio,
+           and reserves its exact shape before the thumbnail arrives */
         .gallery {{
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+            --row-height: {ROW_HEIGHT}px;
+            display: flex;
+            flex-wrap: wrap;
             gap: 1.5rem;
             padding: 2rem;
             max-width: 1400px;
             margin: 0 auto;
         }}
 
+        .gallery::after {{
+            content: '';
+            flex-grow: 999999;
+        }}
+
         .gallery-item {{
             position: relative;
             overflow: hidden;
             border-radius: 8px;
             cursor: pointer;
-            aspect-ratio: 3/2;
+            flex-grow: var(--ratio);
+            flex-basis: calc(var(--ratio) * var(--row-height));
+            aspect-ratio: var(--ratio);
             background: #1a1a1a;
+            background-size: cover;
+        }}
+
+        .gallery-item picture,
+        .lightbox-content picture {{
+            display: contents;
         }}
 
         .gallery-item img {{
@@ -362,9 +526,9 @@ class GalleryGenerator:
             font-size: 0.9rem;
         }}
 
-        @media (max-width: 768px) {{
+        @media (max-width: {MOBILE_BREAKPOINT}px) {{
             .gallery {{
-                grid-template-columns: repeat(auto-fill, minmax(150px, 1fr));
+                --row-height: {MOBILE_ROW_HEIGHT}px;
                 gap: 1rem;
                 padding: 1rem;
             }}
@@ -433,7 +597,7 @@ class GalleryGenerator:
         <button class="lightbox-close" onclick="closeLightbox()">&times;</button>
         <button class="lightbox-nav lightbox-prev" onclick="changeImage(-1)">&#8249;</button>
         <div class="lightbox-content">
-            <img id="lightbox-img" src="" alt="">
+            <picture id="lightbox-picture"><img id="lightbox-img" src="" alt=""></picture>
         </div>
         <button class="lightbox-nav lightbox-next" onclick="changeImage(1)">&#8250;</button>
         <a id="lightbox-download" class="lightbox-download" href="" download>Herunterladen</a>
@@ -449,14 +613,120 @@ class GalleryGenerator:
         const imageFiles = [
             {image_list}
         ];
+        const modernFormats = [{format_list}];
+        const LIGHTBOX_SIZES = '{LIGHTBOX_SIZES}';
 
         // Create paths for different sizes
         const images = {{
-            thumbs: imageFiles.map(file => cdnBase + 'thumbs/' + file),
-            medium: imageFiles.map(file => cdnBase + 'medium/' + file),
-            full: imageFiles.map(file => cdnBase + file)
+            thumbs: imageFiles.map(image => cdnBase + 'thumbs/' + image.file),
+            medium: imageFiles.map(image => cdnBase + 'medium/' + image.file),
+            full: imageFiles.map(image => cdnBase + image.file)
         }};
 
+        function derivativeUrl(size, index, ext) {{
+            const file = ext ? imageFiles[index].file.replace(/\\.[^.]+$/, ext) : imageFiles[index].file;
+            return cdnBase + size + '/' + file;
+        }}
+
+        // Fixed-size candidate, or the image's width ladder when it was generated,
+        // described by each derivative's real pixel width
+        function derivativeSrcset(size, index, ext) {{
+            const ladder = imageFiles[index].ladder;
+            if (!ladder.length) return derivativeUrl(size, index, ext);
+            return ladder.map(([dir, width]) => derivativeUrl('w' + dir, index, ext) + ' ' + width + 'w').join(', ');
+        }}
+
+        // A justified tile is as wide as its aspect ratio times the row height
+        function thumbSizes(index) {{
+            const ratio = imageFiles[index].width / imageFiles[index].height;
+            return `(max-width: {MOBILE_BREAKPOINT}px) ${{Math.ceil(ratio * {MOBILE_ROW_HEIGHT})}}px, ${{Math.ceil(ratio * {ROW_HEIGHT})}}px`;
+        }}
+
+        function createPicture(size, index, imgElement, sizes) {{
+            const picture = document.createElement('picture');
+            modernFormats.forEach(format => {{
+                const source = document.createElement('source');
+                source.type = format.type;
+                source.srcset = derivativeSrcset(size, index, format.ext);
+                if (imageFiles[index].ladder.length) source.sizes = sizes;
+                picture.appendChild(source);
+            }});
+            if (imageFiles[index].ladder.length) {{
+                imgElement.srcset = derivativeSrcset(size, index, null);
+                imgElement.sizes = sizes;
+            }} else {{
+                // The lightbox reuses one <img>; drop the previous image's candidates
+                imgElement.removeAttribute('srcset');
+                imgElement.removeAttribute('sizes');
+            }}
+            picture.appendChild(imgElement);
+            return picture;
+        }}
+
+        // Decode a blurhash into a small data URL (see https://blurha.sh)
+        const BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{{|}}~';
+        const placeholderCanvas = document.createElement('canvas');
+
+        function decode83(str) {{
+            let value = 0;
+            for (const c of str) value = value * 83 + BASE83.indexOf(c);
+            return value;
+        }}
+
+        function placeholderUrl(hash) {{
+            const toLinear = v => {{ v /= 255; return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4); }};
+            const toSrgb = v => {{
+                v = Math.max(0, Math.min(1, v));
+                return Math.round(v <= 0.0031308 ? v * 12.92 * 255 : (1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255);
+            }};
+            const signPow = (v, exp) => Math.sign(v) * Math.pow(Math.abs(v), exp);
+
+            const sizeFlag = decode83(hash[0]);
+            const numX = (sizeFlag % 9) + 1;
+            const numY = Math.floor(sizeFlag / 9) + 1;
+            const maximum = (decode83(hash[1]) + 1) / 166;
+            const dc = decode83(hash.substring(2, 6));
+            const colors = [[toLinear(dc >> 16), toLinear((dc >> 8) & 255), toLinear(dc & 255)]];
+            for (let i = 1; i < numX * numY; i++) {{
+                const value = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+                colors.push([Math.floor(value / 361), Math.floor(value / 19) % 19, value % 19]
+                    .map(q => signPow((q - 9) / 9, 2) * maximum));
+            }}
+
+            const size = 32;
+            placeholderCanvas.width = placeholderCanvas.height = size;
+            const ctx = placeholderCanvas.getContext('2d');
+            const pixels = ctx.createImageData(size, size);
+            for (let y = 0; y < size; y++) {{
+                for (let x = 0; x < size; x++) {{
+                    const rgb = [0, 0, 0];
+                    for (let j = 0; j < numY; j++) {{
+                        for (let i = 0; i < numX; i++) {{
+                            const basis = Math.cos(Math.PI * x * i / size) * Math.cos(Math.PI * y * j / size);
+                            const color = colors[i + j * numX];
+                            rgb[0] += color[0] * basis;
+                            rgb[1] += color[1] * basis;
+                            rgb[2] += color[2] * basis;
+                        }}
+                    }}
+                    const offset = 4 * (x + y * size);
+                    pixels.data.set([toSrgb(rgb[0]), toSrgb(rgb[1]), toSrgb(rgb[2]), 255], offset);
+                }}
+            }}
+            ctx.putImageData(pixels, 0, 0);
+            return placeholderCanvas.toDataURL();
+        }}
+
+        // Point the lightbox <picture> at the medium versions of an image
+        function showLightboxImage(index) {{
+            const lightboxImg = document.getElementById('lightbox-img');
+            const picture = createPicture('medium', index, lightboxImg, LIGHTBOX_SIZES);
+            picture.id = 'lightbox-picture';
+            document.getElementById('lightbox-picture').replaceWith(picture);
+            lightboxImg.src = images.medium[index];
+            document.getElementById('lightbox-download').href = images.full[index];
+        }}
+
         let currentImageIndex = 0;
         let loadedCount = 0;
         const IMAGES_PER_LOAD = 24; // Load 24 images at a time
@@ -481,14 +751,20 @@ class GalleryGenerator:
                 for (let index = loadedCount; index < endIndex; index++) {{
                     const item = document.createElement('div');
                     item.className = 'gallery-item';
+                    item.style.setProperty('--ratio', imageFiles[index].width / imageFiles[index].height);
+                    if (imageFiles[index].placeholder) {{
+                        item.style.backgroundImage = `url(${{placeholderUrl(imageFiles[index].placeholder)}})`;
+                    }}
                     item.onclick = () => openLightbox(index);
 
                     const imgElement = document.createElement('img');
+                    imgElement.width = imageFiles[index].width;
+                    imgElement.height = imageFiles[index].height;
                     imgElement.src = images.thumbs[index];
                     imgElement.alt = `Photo ${{index + 1}}`;
                     imgElement.loading = 'lazy';
 
-                    item.appendChild(imgElement);
+                    item.appendChild(createPicture('thumbs', index, imgElement, thumbSizes(index)));
                     gallery.appendChild(item);
                 }}
 
@@ -521,8 +797,7 @@ class GalleryGenerator:
 
         function openLightbox(index) {{
             currentImageIndex = index;
-            document.getElementById('lightbox-img').src = images.medium[index];
-            document.getElementById('lightbox-download').href = images.full[index];
+            showLightboxImage(index);
             document.getElementById('lightbox').classList.add('active');
             document.body.style.overflow = 'hidden';
         }}
@@ -537,8 +812,7 @@ class GalleryGenerator:
             currentImageIndex += direction;
             if (currentImageIndex < 0) currentImageIndex = images.medium.length - 1;
             if (currentImageIndex >= images.medium.length) currentImageIndex = 0;
-            document.getElementById('lightbox-img').src = images.medium[currentImageIndex];
-            document.getElementById('lightbox-download').href = images.full[currentImageIndex];
+            showLightboxImage(currentImageIndex);
         }}
 
         function toggleSlideshow() {{
@@ -889,13 +1163,28 @@ class GalleryGenerator:
         print(f"Generated: {master_path}")
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate gallery index pages and master-gallery.html from gallery-config.md")
+    parser.add_argument("base_path", nargs="?", default=".",
+                        help="Directory containing gallery-config.md (default: current directory)")
+    parser.add_argument("--gallery", action="append", metavar="DIRECTORY",
+                        help="Only regenerate this gallery's index.html (repeatable)")
+    pages = parser.add_mutually_exclusive_group()
+    pages.add_argument("--no-master", action="store_true", help="Do not regenerate master-gallery.html")
+    pages.add_argument("--master-only", action="store_true", help="Only regenerate master-gallery.html")
+    args = parser.parse_args(argv)
+    if args.master_only and args.gallery:
+        parser.error("--gallery cannot be used with --master-only")
+    return args
+
+
+def main(argv=None):
     """Main entry point"""
-    import sys
+    args = parse_args(argv)
 
     # Get base path from command line or use current directory
-    base_path = sys.argv[1] if len(sys.argv) > 1 else '.'
-    base_path = Path(base_path).resolve()
+    base_path = Path(args.base_path).resolve()
 
     config_path = base_path / 'gallery-config.md'
 
@@ -914,19 +1203,32 @@ def main():
 
     print(f"Found {len(config.galleries)} galleries in configuration")
 
+    if args.master_only:
+        galleries = []
+    elif args.gallery:
+        known = {gallery['directory'] for gallery in config.galleries}
+        for directory in args.gallery:
+            if directory not in known:
+                print(f"Error: Gallery '{directory}' is not in the configuration")
+                sys.exit(1)
+        galleries = [gallery for gallery in config.galleries if gallery['directory'] in args.gallery]
+    else:
+        galleries = config.galleries
+
     # Generate gallery pages
     generator = GalleryGenerator(str(base_path))
 
-    for gallery in config.galleries:
+    for gallery in galleries:
         print(f"\nGenerating gallery for: {gallery['title']} ({gallery['directory']})")
         html = generator.generate_gallery_page(gallery)
         if html:
             generator.save_gallery_page(gallery, html)
 
     # Generate master page
-    print(f"\nGenerating master gallery page...")
-    master_html = generator.generate_master_page(config.galleries)
-    generator.save_master_page(master_html)
+    if not args.no_master:
+        print(f"\nGenerating master gallery page...")
+        master_html = generator.generate_master_page(config.galleries)
+        generator.save_master_page(master_html)
 
     print(f"\n✓ Gallery generation complete!")
 
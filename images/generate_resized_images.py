@@ -1,31 +1,103 @@
 #!/usr/bin/env python3
 """
-Generate thumbnail and medium-sized versions of all JPEG images
+Generate thumbnail, medium-sized and srcset ladder versions of all JPEG
+images, optionally with WebP/AVIF alongside the JPEG fallback
 """
 # /// script
 # dependencies = [
 #   "pillow",
+#   "numpy",
 # ]
 # ///
 
 from PIL import Image
+import argparse
+import hashlib
+import io
+import json
+import math
 import os
 import sys
 import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+try:
+    import pillow_avif  # noqa: F401 -- registers AVIF support on older Pillow
+except ImportError:
+    pass
+
+try:
+    import numpy as np  # only needed for --target-ssim
+except ImportError:
+    np = None
+
 # Configuration
 THUMB_SIZE = (200, 200)  # Max width/height for thumbnails (smaller for faster loading)
 MEDIUM_SIZE = (1200, 1200)  # Max width/height for medium images
+WIDTHS = (320, 640, 960, 1600, 2400)  # Responsive srcset ladder, written to w<width>/
 QUALITY = 80  # JPEG quality (0-100)
+WEBP_QUALITY = 75  # WebP quality (0-100); WebP holds up at lower settings than JPEG
+AVIF_QUALITY = 55  # AVIF quality (0-100)
+SSIM_QUALITY_RANGE = (40, QUALITY)  # JPEG qualities searched with --target-ssim; never above QUALITY
+SSIM_WINDOW = 8  # Side of the square window SSIM is averaged over
+PLACEHOLDER_COMPONENTS = (4, 3)  # Blurhash detail (long side, short side) for page placeholders
+DRAFT_REDUCING_GAP = 2  # Decode JPEGs at no less than this multiple of the largest output size
+MAX_MEMORY_MB = 1024  # Per-worker ceiling for decoded pixel data
+RESAMPLE = 'lanczos'  # Resampling filter, a key of RESAMPLE_FILTERS
+MANIFEST_NAME = ".derivatives.json"  # Per-gallery record of sources and the outputs built from them
+MANIFEST_VERSION = 1
+QUALITY_REPORT_NAME = "quality-report.json"  # Per-gallery --target-ssim results
+
+# Output formats: name -> (extension, Pillow format, quality)
+# JPEG is always written as the fallback and keeps the source filename.
+FORMATS = {
+    'jpeg': (None, 'JPEG', QUALITY),
+    'webp': ('.webp', 'WEBP', WEBP_QUALITY),
+    'avif': ('.avif', 'AVIF', AVIF_QUALITY),
+}
+FORMAT_LABELS = {'jpeg': 'JPEG', 'webp': 'WebP', 'avif': 'AVIF'}
+
+RESAMPLE_FILTERS = {
+    'lanczos': Image.Resampling.LANCZOS,
+    'bicubic': Image.Resampling.BICUBIC,
+    'hamming': Image.Resampling.HAMMING,
+    'bilinear': Image.Resampling.BILINEAR,
+    'box': Image.Resampling.BOX,
+}
+
+# Pipeline stages timed by generate_derivatives
+STAGES = ('decode', 'resize', 'encode', 'write')
+
+def ladder_dir(width):
+    """Output directory name for a srcset ladder width"""
+    return f"w{width}"
+
+def ladder_size(width):
+    """Max size for a ladder width: the width is fixed, the height is free"""
+    return (width, width * 100)
+
+def source_ladder(widths, source_width):
+    """The ladder widths to write for a source of the given width
 
-def create_directories(source_dir):
+    Derivatives are never upscaled, so widths at or above the source's are
+    replaced by a single one at the source's own width.
+    """
+    ladder = [width for width in sorted(widths) if width < source_width]
+    if len(ladder) < len(widths):
+        ladder.append(source_width)
+    return ladder
+
+def create_directories(source_dir, widths=()):
     """Create output directories if they don't exist"""
     thumb_dir = os.path.join(source_dir, "thumbs")
     medium_dir = os.path.join(source_dir, "medium")
 
     os.makedirs(thumb_dir, exist_ok=True)
     os.makedirs(medium_dir, exist_ok=True)
+    for width in widths:
+        os.makedirs(os.path.join(source_dir, ladder_dir(width)), exist_ok=True)
 
     return thumb_dir, medium_dir
 
@@ -42,102 +114,740 @@ def find_images(source_dir):
 
     return sorted(files)
 
-def resize_image(input_path, output_path, max_size, quality=QUALITY):
-    """Resize an image while maintaining aspect ratio"""
+def available_formats():
+    """Output formats this Pillow build can encode"""
+    Image.init()
+    return [name for name, (_, pil_format, _) in FORMATS.items() if pil_format in Image.SAVE]
+
+def output_filename(filename, fmt):
+    """Name of the derivative of filename in the given format"""
+    extension = FORMATS[fmt][0]
+    if extension is None:
+        return filename
+    return os.path.splitext(filename)[0] + extension
+
+def save_options(fmt, quality=None):
+    """Pillow save() arguments for an output format"""
+    _, pil_format, default_quality = FORMATS[fmt]
+    options = {'format': pil_format, 'quality': quality or default_quality}
+    if fmt == 'jpeg':
+        options['optimize'] = True
+    elif fmt == 'webp':
+        options['method'] = 6
+    return options
+
+def fit_size(size, max_size):
+    """Return the size Image.thumbnail() would produce for max_size"""
+    width, height = size
+    ratio = min(max_size[0] / width, max_size[1] / height, 1)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+def to_rgb(img):
+    """Flatten transparency onto white and convert to RGB"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+def decoded_bytes(mode, size):
+    """Approximate memory Pillow needs to hold an image, plus an RGB copy if converted"""
+    pixels = size[0] * size[1]
+    # Pillow stores 1-band 8-bit modes in one byte per pixel, everything else in four
+    stored = pixels * (1 if mode in ('1', 'L', 'P') else 2 if mode.startswith('I;16') else 4)
+    if mode not in ('RGB', 'RGBA', 'LA'):
+        stored += pixels * 4
+    return stored
+
+def decode_scale(size, target, max_memory):
+    """Pick the JPEG DCT scale (1, 2, 4 or 8) to decode a source of size at
+
+    The largest scale that still leaves DRAFT_REDUCING_GAP times the target
+    size, unless a smaller decode is needed to stay under max_memory bytes.
+    """
+    width, height = size
+    scale = 1
+    for candidate in (2, 4, 8):
+        if (width // candidate >= target[0] * DRAFT_REDUCING_GAP
+                and height // candidate >= target[1] * DRAFT_REDUCING_GAP):
+            scale = candidate
+
+    while scale < 8 and decoded_bytes('RGB', (width // scale, height // scale)) > max_memory:
+        scale *= 2
+    return scale
+
+def reduced_decode_scale(size, max_size, max_memory):
+    """The DCT scale a JPEG of size is decoded at for a max_size output, if
+    staying under max_memory bytes makes that output smaller than requested
+
+    Returns None when the output comes out at its full size.
+    """
+    target = fit_size(size, max_size)
+    scale = decode_scale(size, target, max_memory)
+    # draft() rounds the decoded size up
+    decoded = (-(-size[0] // scale), -(-size[1] // scale))
+    return scale if fit_size(decoded, max_size) != target else None
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+def base83(value, length):
+    """Encode an integer as fixed-length base83"""
+    return ''.join(BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+def blurhash(img, components=PLACEHOLDER_COMPONENTS):
+    """Encode an image as a blurhash placeholder string (~30 characters)
+
+    The image is shrunk to 32x32 first; blurhash only keeps a handful of
+    low-frequency components, so nothing is lost by doing so.
+    """
+    if img.width >= img.height:
+        x_components, y_components = components
+    else:
+        y_components, x_components = components
+    size = 32
+    data = img.convert('RGB').resize((size, size), Image.Resampling.BOX).tobytes()
+    pixels = [data[i:i + 3] for i in range(0, len(data), 3)]
+
+    def to_linear(value):
+        value /= 255
+        return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+    def to_srgb(value):
+        value = min(max(value, 0), 1)
+        if value <= 0.0031308:
+            return int(value * 12.92 * 255 + 0.5)
+        return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+    linear = [(to_linear(r), to_linear(g), to_linear(b)) for r, g, b in pixels]
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / size) for y in range(size)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / size) for x in range(size)]
+            scale = (1 if i == 0 and j == 0 else 2) / (size * size)
+            totals = [0.0, 0.0, 0.0]
+            for index, pixel in enumerate(linear):
+                basis = cos_x[index % size] * cos_y[index // size]
+                for channel in range(3):
+                    totals[channel] += basis * pixel[channel]
+            factors.append([total * scale for total in totals])
+
+    dc, ac = factors[0], factors[1:]
+    result = base83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(v) for factor in ac for v in factor) * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        result += base83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += base83(0, 1)
+
+    result += base83((to_srgb(dc[0]) << 16) + (to_srgb(dc[1]) << 8) + to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        return max(0, min(18, int(math.copysign(abs(value / maximum) ** 0.5, value) * 9 + 9.5)))
+
+    for factor in ac:
+        r, g, b = (quantise(v) for v in factor)
+        result += base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+def ssim(img_a, img_b, window=SSIM_WINDOW):
+    """Mean structural similarity of two same-sized images, on luma
+
+    Uses a uniform window computed with summed-area tables, which tracks the
+    Gaussian-window SSIM closely at a fraction of the cost.
+    """
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    def window_mean(values):
+        table = np.pad(values.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        total = (table[window:, window:] - table[:-window, window:]
+                 - table[window:, :-window] + table[:-window, :-window])
+        return total / (window * window)
+
+    a = np.asarray(img_a.convert('L'), dtype=np.float64)
+    b = np.asarray(img_b.convert('L'), dtype=np.float64)
+    mean_a = window_mean(a)
+    mean_b = window_mean(b)
+    var_a = window_mean(a * a) - mean_a * mean_a
+    var_b = window_mean(b * b) - mean_b * mean_b
+    covar = window_mean(a * b) - mean_a * mean_b
+
+    ssim_map = ((2 * mean_a * mean_b + c1) * (2 * covar + c2)) / (
+        (mean_a * mean_a + mean_b * mean_b + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def encode(img, fmt, quality=None):
+    """Encode an image in memory, returning the bytes"""
+    buffer = io.BytesIO()
+    img.save(buffer, **save_options(fmt, quality))
+    return buffer.getvalue()
+
+def find_jpeg_quality(img, target_ssim):
+    """Binary-search the lowest JPEG quality whose SSIM reaches target_ssim
+
+    Returns (quality, reached). Falls back to QUALITY, with reached False,
+    when none in SSIM_QUALITY_RANGE does, or when the image is too small to
+    hold an SSIM window.
+    """
+    if min(img.size) < SSIM_WINDOW:
+        return QUALITY, False
+    low, high = SSIM_QUALITY_RANGE
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        with Image.open(io.BytesIO(encode(img, 'jpeg', quality))) as decoded:
+            score = ssim(img, decoded)
+        if score >= target_ssim:
+            best = quality
+            high = quality - 1
+        else:
+            low = quality + 1
+    if best is None:
+        return QUALITY, False
+    return best, True
+
+def generate_derivatives(input_path, outputs, quality=None, target_ssim=None, stats=None,
+                         max_memory_mb=MAX_MEMORY_MB, resample=RESAMPLE):
+    """Decode an image once and write every requested resized version
+
+    outputs is a list of (output_path, max_size, fmt) tuples, where fmt is a
+    key of FORMATS. JPEG sources are decoded with draft() DCT scaling down to
+    the smallest scale that still leaves DRAFT_REDUCING_GAP times the largest
+    target, then each output is resized from the previous (larger) one rather
+    than from the source, with the resample filter (a key of
+    RESAMPLE_FILTERS). quality overrides the format's default.
+
+    Decoded pixel data is kept under max_memory_mb: JPEGs that would exceed
+    it are decoded at a smaller DCT scale (so the largest outputs may come
+    out smaller than requested), and other images that would exceed it fail
+    with an error instead of exhausting the worker's memory. Transparency
+    is flattened after the first resize rather than at full size.
+
+    With target_ssim, the JPEG quality is chosen per image: the lowest
+    quality whose medium-sized version reaches that SSIM is used for every
+    JPEG output. If stats is a dict it receives a blurhash 'placeholder'
+    made from the smallest output, the pixel 'widths' of each output, the
+    'decode_scale' if memory forced a
+    reduced decode and, with target_ssim, the chosen 'jpeg_quality', whether
+    it reached the target ('ssim_reached') and the 'baseline_sizes' each
+    JPEG output would have had at QUALITY.
+
+    Returns None on success or the error message on failure, so that callers
+    running in worker processes can report it in order.
+    """
+    resample_filter = RESAMPLE_FILTERS[resample]
+    timings = dict.fromkeys(STAGES, 0.0)
+    if stats is not None:
+        stats['timings'] = timings
+        stats['widths'] = {}
+    started = time.perf_counter()
+
+    def lap(stage):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] += now - started
+        started = now
+
     try:
         with Image.open(input_path) as img:
-            # Convert RGBA to RGB if needed
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
+            # Largest first, so each derivative can be made from the one before it
+            def area(output):
+                width, height = fit_size(img.size, output[1])
+                return width * height
+            outputs = sorted(outputs, key=area, reverse=True)
+
+            max_memory = max_memory_mb * 1024 * 1024
+            target = fit_size(img.size, outputs[0][1])
+            if img.format == 'JPEG':
+                scale = decode_scale(img.size, target, max_memory)
+                if scale > 1:
+                    img.draft('RGB', (img.width // scale, img.height // scale))
+                if stats is not None and fit_size(img.size, outputs[0][1]) != target:
+                    stats['decode_scale'] = scale
+
+            needed = decoded_bytes(img.mode, img.size)
+            if needed > max_memory:
+                raise MemoryError(f"decoding {img.width}x{img.height} {img.mode} needs about "
+                                  f"{needed / 1024 / 1024:.0f} MB, over the {max_memory_mb} MB limit")
+            img.load()
+
+            # Alpha is kept through the first resize and flattened after it
+            if img.mode == 'P':
+                img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            elif img.mode not in ('RGB', 'RGBA', 'LA'):
                 img = img.convert('RGB')
+            lap('decode')
+
+            jpeg_quality = quality
+            if target_ssim and any(fmt == 'jpeg' for _, _, fmt in outputs):
+                probe = img.resize(fit_size(img.size, MEDIUM_SIZE), resample_filter, reducing_gap=2.0)
+                lap('resize')
+                jpeg_quality, reached = find_jpeg_quality(to_rgb(probe), target_ssim)
+                lap('encode')
+                if stats is not None:
+                    stats['jpeg_quality'] = jpeg_quality
+                    stats['ssim_reached'] = reached
+                    stats['baseline_sizes'] = {}
+
+            for output_path, max_size, fmt in outputs:
+                # Calculate new size maintaining aspect ratio
+                # (a no-op when the previous output had the same size)
+                img.thumbnail(max_size, resample_filter)
+                img = to_rgb(img)
+                if stats is not None:
+                    stats['widths'][output_path] = img.width
+                lap('resize')
 
-            # Calculate new size maintaining aspect ratio
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+                # Encode with optimization, then write
+                if fmt == 'jpeg':
+                    data = encode(img, fmt, jpeg_quality)
+                    if target_ssim and stats is not None:
+                        stats['baseline_sizes'][output_path] = len(encode(img, fmt, QUALITY))
+                else:
+                    data = encode(img, fmt, quality)
+                lap('encode')
+                with open(output_path, 'wb') as f:
+                    f.write(data)
+                lap('write')
 
-            # Save with optimization
-            img.save(output_path, 'JPEG', quality=quality, optimize=True)
+            if stats is not None:
+                stats['placeholder'] = blurhash(img)
+                lap('resize')
 
-        return True
+        return None
     except Exception as e:
-        print(f"  ✗ Error: {str(e)}")
+        return str(e)
+
+def resize_image(input_path, output_path, max_size, quality=QUALITY):
+    """Resize an image while maintaining aspect ratio"""
+    return generate_derivatives(input_path, [(output_path, max_size, 'jpeg')], quality)
+
+def resize_params(resample=RESAMPLE):
+    """Settings that affect every output; a change forces a full rebuild
+
+    Per-format quality is stored with each output instead, so enabling a new
+    format only adds outputs rather than re-encoding the existing ones.
+    """
+    params = {
+        'thumb_size': list(THUMB_SIZE),
+        'medium_size': list(MEDIUM_SIZE),
+        'draft_reducing_gap': DRAFT_REDUCING_GAP,
+    }
+    # Only recorded when changed, so existing manifests stay valid
+    if resample != 'lanczos':
+        params['resample'] = resample
+    return params
+
+def load_manifest(source_dir):
+    """Load the gallery manifest, or an empty one if missing or unreadable"""
+    manifest_path = os.path.join(source_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'files': {}}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'files': {}}
+    return manifest
+
+def save_manifest(source_dir, manifest):
+    """Write the gallery manifest atomically"""
+    manifest_path = os.path.join(source_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def file_sha256(path):
+    """Hash a file in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def output_record(path, quality, width=None):
+    """Manifest record for a written output, with its pixel width if known"""
+    record = {'size': os.path.getsize(path), 'sha256': file_sha256(path), 'quality': quality}
+    if width is not None:
+        record['width'] = width
+    return record
+
+def output_ok(path, record, quality, verify):
+    """Check an output matches its manifest record
+
+    Without verify only the size and quality setting are compared; with
+    verify the content hash is checked and the image is fully decoded.
+    """
+    if not record or record.get('quality') != quality:
         return False
+    try:
+        if os.path.getsize(path) != record['size']:
+            return False
+    except OSError:
+        return False
+
+    if verify:
+        if file_sha256(path) != record['sha256']:
+            return False
+        try:
+            with Image.open(path) as img:
+                img.load()
+        except Exception:
+            return False
+    return True
+
+def quality_setting(fmt, target_ssim=None):
+    """The quality setting recorded for an output; a change forces a rebuild"""
+    if fmt == 'jpeg' and target_ssim:
+        return f"ssim>={target_ssim}"
+    return FORMATS[fmt][2]
+
+def process_image(image_path, thumb_dir, medium_dir, entry=None, verify=False, formats=('jpeg',), widths=(),
+                  target_ssim=None, max_memory_mb=MAX_MEMORY_MB, resample=RESAMPLE):
+    """Create the resized versions of a single image
+
+    entry is this file's record from the gallery manifest (or None). Outputs
+    are only rebuilt when the source content or the resize parameters have
+    changed, or when an output is missing (or, with verify, corrupt).
+    A medium, a thumbnail and one image per ladder width are written for
+    each of formats; ladder widths at or above the source's width become a
+    single output at its own width (see source_ladder), and each ladder
+    output records its pixel width for the srcset. With target_ssim the JPEG quality is searched per image
+    and recorded, with the size at the fixed QUALITY, in the output records.
+    max_memory_mb bounds the decoded pixel data and resample is the filter
+    (see generate_derivatives). A JPEG that memory forces to a reduced
+    decode records its decode scale, and is rebuilt when a different limit
+    would change it.
+
+    Runs in a worker process, so nothing is printed here. Returns a
+    (status, lines, entry, timings) tuple where status is 'processed',
+    'skipped' or 'failed', lines is the progress output for the parent to
+    print in order, entry is the updated manifest record (None on failure)
+    and timings holds the seconds spent in each pipeline stage.
+    """
+    filename = os.path.basename(image_path)
+    source_dir = os.path.dirname(image_path)
+    lines = []
+    try:
+        with Image.open(image_path) as img:
+            source_size, source_format = img.size, img.format
+            source_width = img.width
+    except Exception as e:
+        lines.append(f"  ✗ Error: {e}")
+        return 'failed', lines, None, {}
+
+    sizes = [(medium_dir, MEDIUM_SIZE, 'Medium'), (thumb_dir, THUMB_SIZE, 'Thumbnail')]
+    ladder_dirs = set()
+    for width in source_ladder(widths, source_width):
+        ladder_dirs.add(os.path.join(source_dir, ladder_dir(width)))
+        sizes.append((os.path.join(source_dir, ladder_dir(width)), ladder_size(width), f"{width}w"))
+
+    targets = []
+    for out_dir, size, label in sizes:
+        for fmt in formats:
+            path = os.path.join(out_dir, output_filename(filename, fmt))
+            targets.append((path, size, fmt, f"{label} {FORMAT_LABELS[fmt]}"))
+    params = resize_params(resample)
+
+    # The decode scale depends on the largest output and the memory limit
+    scale = None
+    if source_format == 'JPEG':
+        largest = max((size for _, size, _, _ in targets),
+                      key=lambda size: fit_size(source_size, size)[0] * fit_size(source_size, size)[1])
+        scale = reduced_decode_scale(source_size, largest, max_memory_mb * 1024 * 1024)
+    decode = {'decode_scale': scale} if scale else {}
+
+    stat = os.stat(image_path)
+    source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    # Size and mtime unchanged means the content is too; otherwise hash it
+    entry = entry or {}
+    if entry.get('size') == source['size'] and entry.get('mtime_ns') == source['mtime_ns']:
+        source['sha256'] = entry.get('sha256')
+    else:
+        source['sha256'] = file_sha256(image_path)
+
+    unchanged = (entry.get('sha256') == source['sha256'] and entry.get('params') == params
+                 and entry.get('decode_scale') == scale)
+    old_outputs = entry.get('outputs', {}) if unchanged else {}
+
+    # Outputs of formats or widths that are no longer requested drop out of the record
+    outputs = {}
+    missing = []
+    for target in targets:
+        key = os.path.relpath(target[0], source_dir)
+        quality = quality_setting(target[2], target_ssim)
+        if output_ok(target[0], old_outputs.get(key), quality, verify):
+            outputs[key] = old_outputs[key]
+        else:
+            missing.append(target)
+
+    if not missing:
+        lines.append(f"  ⊘ Up to date, skipping")
+        placeholder = unchanged and entry.get('placeholder')
+        if not placeholder:
+            # Made from the existing thumbnail, for manifests that predate placeholders
+            try:
+                with Image.open(os.path.join(thumb_dir, filename)) as thumb:
+                    placeholder = blurhash(thumb)
+            except Exception as e:
+                lines.append(f"  ✗ Could not make placeholder: {e}")
+        return 'skipped', lines, dict(source, params=params, outputs=outputs, placeholder=placeholder, **decode), {}
 
-def process_images(source_dir):
-    """Process all images and create resized versions"""
+    if not unchanged and entry:
+        lines.append(f"  Source or settings changed, rebuilding")
+    for target in targets:
+        if target not in missing:
+            lines.append(f"  ⊘ {target[3]} up to date")
+
+    # Generate all missing versions from a single decode
+    labels = ', '.join(label.lower() for _, _, _, label in missing)
+    lines.append(f"  Creating {labels}...")
+    for out_dir in ladder_dirs:
+        os.makedirs(out_dir, exist_ok=True)
+    stats = {}
+    error = generate_derivatives(image_path, [(path, size, fmt) for path, size, fmt, _ in missing],
+                                 target_ssim=target_ssim, stats=stats, max_memory_mb=max_memory_mb,
+                                 resample=resample)
+    if error:
+        lines.append(f"  ✗ Error: {error}")
+        return 'failed', lines, None, stats['timings']
+
+    if 'decode_scale' in stats:
+        lines.append(f"  ⚠ Decoded at 1/{stats['decode_scale']} scale to stay under {max_memory_mb} MB; "
+                     f"the largest versions are smaller than requested")
+
+    if 'jpeg_quality' in stats:
+        if stats['ssim_reached']:
+            lines.append(f"  JPEG quality {stats['jpeg_quality']} reaches SSIM {target_ssim}")
+        else:
+            lines.append(f"  ⚠ SSIM {target_ssim} target not reached, using JPEG quality {stats['jpeg_quality']}")
+
+    for path, _, fmt, label in missing:
+        width = stats['widths'][path] if os.path.dirname(path) in ladder_dirs else None
+        record = output_record(path, quality_setting(fmt, target_ssim), width)
+        if path in stats.get('baseline_sizes', {}):
+            record['chosen_quality'] = stats['jpeg_quality']
+            record['ssim_reached'] = stats['ssim_reached']
+            record['baseline_size'] = stats['baseline_sizes'][path]
+        outputs[os.path.relpath(path, source_dir)] = record
+        lines.append(f"    ✓ {label} created ({record['size'] / 1024:.1f} KB)")
+
+    entry = dict(source, params=params, outputs=outputs, placeholder=stats['placeholder'], **decode)
+    return 'processed', lines, entry, stats['timings']
+
+def write_quality_report(source_dir, manifest, target_ssim):
+    """Summarise the --target-ssim JPEG qualities and byte savings for a gallery
+
+    Returns the report, which is also written to QUALITY_REPORT_NAME.
+    """
+    files = {}
+    for filename, entry in sorted(manifest['files'].items()):
+        records = [record for record in entry.get('outputs', {}).values() if 'chosen_quality' in record]
+        if records:
+            files[filename] = {
+                'quality': records[0]['chosen_quality'],
+                # None for outputs written before this was recorded
+                'target_reached': records[0].get('ssim_reached'),
+                'bytes': sum(record['size'] for record in records),
+                'baseline_bytes': sum(record['baseline_size'] for record in records),
+            }
+
+    total = sum(item['bytes'] for item in files.values())
+    baseline = sum(item['baseline_bytes'] for item in files.values())
+    report = {
+        'target_ssim': target_ssim,
+        'baseline_quality': QUALITY,
+        'total_bytes': total,
+        'total_baseline_bytes': baseline,
+        'saved_percent': round(100 * (baseline - total) / baseline, 1) if baseline else 0.0,
+        'files_below_target': sum(item['target_reached'] is False for item in files.values()),
+        'files': files,
+    }
+
+    with open(os.path.join(source_dir, QUALITY_REPORT_NAME), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def process_images(source_dir, jobs=None, verify=False, formats=('jpeg',), widths=WIDTHS, target_ssim=None,
+                   max_memory_mb=MAX_MEMORY_MB, resample=RESAMPLE):
+    """Process all images and create resized versions
+
+    Only images whose source or resize settings changed since the last run
+    (as recorded in the gallery manifest) are rebuilt. With verify, existing
+    outputs are also decoded to catch corrupt files. formats lists the output
+    formats to write; JPEG is always included as the fallback. widths is the
+    srcset ladder written alongside the thumbnail and medium versions. With
+    target_ssim, JPEG quality is chosen per image and a quality report is
+    written to the gallery. max_memory_mb is the decoded pixel data ceiling
+    for each worker and resample the resampling filter.
+
+    With jobs > 1 the images are resized in a process pool. Results are
+    collected in input order, so the progress output and the summary are the
+    same as for a sequential run.
+
+    Returns the summary counts, plus the seconds spent in each pipeline
+    stage summed over all workers as 'timings'.
+    """
+    widths = sorted(set(widths))
+    # Ladder directories are made per image, as they depend on its width
     thumb_dir, medium_dir = create_directories(source_dir)
     images = find_images(source_dir)
 
     if not images:
         print(f"No JPEG images found in directory: {source_dir}")
-        return
+        return {'processed': 0, 'skipped': 0, 'failed': 0, 'total': 0, 'timings': dict.fromkeys(STAGES, 0.0)}
+
+    jobs = min(jobs or os.cpu_count() or 1, len(images))
+    formats = ['jpeg'] + [fmt for fmt in formats if fmt != 'jpeg']
 
     print(f"Processing images in: {source_dir}")
-    print(f"Found {len(images)} image(s) to process\n")
-
-    processed = 0
-    skipped = 0
-    failed = 0
-
-    for idx, image_path in enumerate(images, 1):
-        filename = os.path.basename(image_path)
-        print(f"[{idx}/{len(images)}] Processing {filename}...")
-
-        thumb_path = os.path.join(thumb_dir, filename)
-        medium_path = os.path.join(medium_dir, filename)
-
-        # Check if both versions already exist
-        if os.path.exists(thumb_path) and os.path.exists(medium_path):
-            print(f"  ⊘ Already processed, skipping\n")
-            skipped += 1
-            continue
-
-        # Generate thumbnail
-        if not os.path.exists(thumb_path):
-            print(f"  Creating thumbnail...")
-            if not resize_image(image_path, thumb_path, THUMB_SIZE):
-                failed += 1
-                continue
-            thumb_size = os.path.getsize(thumb_path) / 1024
-            print(f"    ✓ Thumbnail created ({thumb_size:.1f} KB)")
-        else:
-            print(f"  ⊘ Thumbnail exists")
-
-        # Generate medium version
-        if not os.path.exists(medium_path):
-            print(f"  Creating medium version...")
-            if not resize_image(image_path, medium_path, MEDIUM_SIZE):
-                failed += 1
-                continue
-            medium_size = os.path.getsize(medium_path) / 1024
-            print(f"    ✓ Medium created ({medium_size:.1f} KB)")
-        else:
-            print(f"  ⊘ Medium exists")
+    print(f"Found {len(images)} image(s) to process ({jobs} worker(s))")
+    print(f"Formats: {', '.join(FORMAT_LABELS[fmt] for fmt in formats)}")
+    print(f"Widths: {', '.join(str(width) for width in widths) or 'none'}\n")
+
+    manifest = load_manifest(source_dir)
+    old_entries = manifest['files']
+    # Sources that have been removed drop out of the manifest
+    manifest['files'] = {}
 
-        print()
-        processed += 1
+    counts = {'processed': 0, 'skipped': 0, 'failed': 0}
+    timings = dict.fromkeys(STAGES, 0.0)
+    filenames = [os.path.basename(image_path) for image_path in images]
+    args = (
+        images,
+        [thumb_dir] * len(images),
+        [medium_dir] * len(images),
+        [old_entries.get(filename) for filename in filenames],
+        [verify] * len(images),
+        [formats] * len(images),
+        [widths] * len(images),
+        [target_ssim] * len(images),
+        [max_memory_mb] * len(images),
+        [resample] * len(images),
+    )
+
+    if jobs == 1:
+        results = map(process_image, *args)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        results = executor.map(process_image, *args)
+
+    try:
+        for idx, (filename, (status, lines, entry, image_timings)) in enumerate(zip(filenames, results), 1):
+            print(f"[{idx}/{len(images)}] Processing {filename}...")
+            for line in lines:
+                print(line)
+            print()
+            counts[status] += 1
+            for stage, seconds in image_timings.items():
+                timings[stage] += seconds
+            if entry:
+                manifest['files'][filename] = entry
+    finally:
+        if executor:
+            executor.shutdown()
+        # Keep records for anything not reached (e.g. after Ctrl-C)
+        for filename in filenames:
+            if filename not in manifest['files'] and filename in old_entries:
+                manifest['files'][filename] = old_entries[filename]
+        save_manifest(source_dir, manifest)
 
     print(f"="*60)
     print(f"Summary:")
-    print(f"  - Processed: {processed}")
-    print(f"  - Skipped (already exists): {skipped}")
-    print(f"  - Failed: {failed}")
+    print(f"  - Processed: {counts['processed']}")
+    print(f"  - Skipped (up to date): {counts['skipped']}")
+    print(f"  - Failed: {counts['failed']}")
     print(f"  - Total: {len(images)}")
 
+    if target_ssim:
+        report = write_quality_report(source_dir, manifest, target_ssim)
+        print(f"  - JPEG bytes at SSIM {target_ssim}: {report['total_bytes'] / 1024 / 1024:.1f} MB "
+              f"(vs {report['total_baseline_bytes'] / 1024 / 1024:.1f} MB at quality {QUALITY}, "
+              f"{report['saved_percent']}% saved)")
+        if report['files_below_target']:
+            print(f"  - {report['files_below_target']} image(s) did not reach SSIM {target_ssim} "
+                  f"and kept quality {QUALITY}")
+
+    return dict(counts, total=len(images), timings=timings)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate thumbnail and medium-sized versions of all JPEG images",
+        epilog="Example: python generate_resized_images.py /path/to/images/2025-ff-cologne",
+    )
+    parser.add_argument("directory", help="Directory containing the source JPEG images")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Decode existing outputs and rebuild any that are missing or corrupt")
+    parser.add_argument("--formats", default="jpeg",
+                        help="Comma-separated output formats: jpeg, webp, avif (default: jpeg). "
+                             "JPEG is always written as the fallback")
+    parser.add_argument("--widths", default=",".join(str(width) for width in WIDTHS),
+                        help="Comma-separated srcset ladder widths, or 'none' "
+                             f"(default: {','.join(str(width) for width in WIDTHS)})")
+    parser.add_argument("--target-ssim", type=float, default=None,
+                        help="Choose the lowest JPEG quality per image that reaches this SSIM "
+                             "(e.g. 0.985) instead of the fixed quality; needs NumPy")
+    parser.add_argument("--max-memory-mb", type=int, default=MAX_MEMORY_MB,
+                        help="Per-worker ceiling for decoded image data; larger JPEGs are decoded "
+                             f"at reduced scale, other images fail (default: {MAX_MEMORY_MB})")
+    parser.add_argument("--resample", choices=RESAMPLE_FILTERS, default=RESAMPLE,
+                        help=f"Resampling filter (default: {RESAMPLE})")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.max_memory_mb < 1:
+        parser.error("--max-memory-mb must be at least 1")
+
+    if args.target_ssim is not None:
+        if not 0 < args.target_ssim < 1:
+            parser.error("--target-ssim must be between 0 and 1")
+        if np is None:
+            parser.error("--target-ssim needs NumPy (pip install numpy)")
+
+    if args.widths.strip().lower() == 'none':
+        args.widths = []
+    else:
+        try:
+            args.widths = [int(width) for width in args.widths.split(',') if width.strip()]
+        except ValueError:
+            parser.error(f"--widths must be a comma-separated list of integers")
+        if any(width < 1 for width in args.widths):
+            parser.error("--widths must be positive")
+
+    args.formats = [fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip()]
+    for fmt in args.formats:
+        if fmt not in FORMATS:
+            parser.error(f"unknown format '{fmt}' (choose from {', '.join(FORMATS)})")
+    supported = available_formats()
+    for fmt in args.formats:
+        if fmt not in supported:
+            print(f"Warning: this Pillow build cannot write {FORMAT_LABELS[fmt]}, skipping it")
+    args.formats = [fmt for fmt in args.formats if fmt in supported]
+    return args
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python generate_resized_images.py <directory_path>")
-        print("Example: python generate_resized_images.py /path/to/images/2025-ff-cologne")
-        sys.exit(1)
+    args = parse_args()
 
-    source_dir = os.path.abspath(sys.argv[1])
+    source_dir = os.path.abspath(args.directory)
 
     if not os.path.isdir(source_dir):
         print(f"Error: '{source_dir}' is not a valid directory")
         sys.exit(1)
 
-    process_images(source_dir)
+    process_images(source_dir, jobs=args.jobs, verify=args.verify, formats=args.formats,
+                   widths=args.widths, target_ssim=args.target_ssim, max_memory_mb=args.max_memory_mb,
+                   resample=args.resample)
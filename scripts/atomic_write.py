@@ -0,0 +1,24 @@
+"""
+Write generated files so readers never see them half written.
+"""
+
+import os
+import tempfile
+
+
+def write_atomic(file_path, parts):
+    """
+    Stream the pieces of a file into a temporary file beside file_path,
+    then rename it into place.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for part in parts:
+                f.write(part)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,116 @@
+"""
+Benchmark extract_blog_content's engines on saved Hey pages.
+
+Pages are read from a directory of saved pages (*.html, or the *.body
+files in the scraper's HTTP cache, which is the default). With no saved
+pages, --synthetic generates Hey-like pages instead. For each engine this
+reports the mean parse time per page, the speedup over the original full
+html.parser tree, and whether its output matches the original exactly.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+
+from scrape_hey_blog_page_content import (
+    EXTRACTION_ENGINES,
+    HTTP_CACHE_DIR,
+    extract_blog_content,
+    lxml,
+)
+
+BASELINE_ENGINE = "soup"
+
+
+def load_pages(page_dir):
+    paths = sorted(
+        glob.glob(os.path.join(page_dir, "*.html")) + glob.glob(os.path.join(page_dir, "*.body"))
+    )
+    pages = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            pages.append(f.read())
+    return pages
+
+
+def synthetic_page(n, paragraphs=40):
+    """A page shaped like a Hey post: heavy chrome around one trix-content div"""
+    nav = "".join(f'<li><a href="/p/{i}" class="nav-link">Post {i}</a></li>' for i in range(60))
+    body = "".join(
+        f"<div>Paragraph {i} of post {n}, with <strong>bold</strong>, <em>emphasis</em> and "
+        f'<a href="https://example.com/{i}">a link</a>.<br>Second line &amp; more.</div>'
+        for i in range(paragraphs)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Post</title>"
+        + "".join(f'<meta name="m{i}" content="{"x" * 40}">' for i in range(30))
+        + '<script>window.data = {"a": "<div class=\'trix-content\'>"};</script>'
+        + f'</head><body><header><nav><ul>{nav}</ul></nav></header>'
+        + f'<main><article><h1>Post {n}</h1><div class="trix-content">{body}'
+        + '<figure><img src="a.jpg" alt="a"><figcaption>Caption</figcaption></figure></div>'
+        + f'</article></main><footer><ul>{nav}</ul></footer></body></html>'
+    )
+
+
+def benchmark(pages, engines, repeat):
+    expected = [extract_blog_content(page, BASELINE_ENGINE) for page in pages]
+    results = {}
+    for engine in engines:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            outputs = [extract_blog_content(page, engine) for page in pages]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[engine] = {
+            "ms_per_page": round(best / len(pages) * 1000, 3),
+            "matches_baseline": outputs == expected,
+        }
+    baseline = results[BASELINE_ENGINE]["ms_per_page"]
+    for result in results.values():
+        result["speedup"] = round(baseline / result["ms_per_page"], 2) if result["ms_per_page"] else None
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument(
+        "page_dir",
+        nargs="?",
+        default=HTTP_CACHE_DIR,
+        help="directory of saved pages (default: the scraper's HTTP cache)",
+    )
+    arg_parser.add_argument(
+        "--synthetic", type=int, metavar="N", help="benchmark N generated pages instead"
+    )
+    arg_parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per engine; the best is kept (default: 3)"
+    )
+    arg_parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = arg_parser.parse_args()
+
+    if args.synthetic:
+        pages = [synthetic_page(n) for n in range(args.synthetic)]
+    else:
+        pages = load_pages(args.page_dir)
+    if not pages:
+        arg_parser.error(f"no saved pages in {args.page_dir}; pass a directory or --synthetic N")
+
+    engines = [engine for engine in EXTRACTION_ENGINES if engine != "lxml" or lxml]
+    if not lxml:
+        logging.warning("lxml is not installed, skipping the lxml engine")
+    results = benchmark(pages, engines, args.repeat)
+
+    if args.json:
+        print(json.dumps({"pages": len(pages), "engines": results}, indent=2))
+    else:
+        print(f"{len(pages)} pages")
+        print(f"{'engine':<10} {'ms/page':>10} {'speedup':>8}  matches {BASELINE_ENGINE}")
+        for engine, result in results.items():
+            print(
+                f"{engine:<10} {result['ms_per_page']:>10.3f} {result['speedup']:>7.2f}x  "
+                f"{'yes' if result['matches_baseline'] else 'NO'}"
+            )
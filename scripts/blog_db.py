@@ -0,0 +1,293 @@
+"""
+Shared access to blog_posts.db.
+
+connect() opens the database and brings its schema up to date. Schema
+changes are numbered migrations, tracked with PRAGMA user_version, so each
+one runs once per database.
+
+upsert_posts() is the bulk write path: it takes any iterable of post rows
+and commits them in batches on one connection, replacing existing posts
+with the same link, so re-running an ingest is idempotent.
+
+search_posts() queries posts_fts, an FTS5 index of each post's title and
+text. Triggers on posts queue changed rows in posts_fts_pending using
+plain SQL, so any client can write to posts; index_pending_posts() strips
+their HTML in Python and indexes them, after every upsert_posts() batch
+and whenever connect() opens the database.
+"""
+
+import logging
+import sqlite3
+import os
+from html.parser import HTMLParser
+
+# Get the base directory of the script
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Path to the database
+DB_PATH = os.path.join(BASE_DIR, "../data/blog_posts.db")
+
+BATCH_SIZE = 100  # posts per transaction in upsert_posts
+
+POST_COLUMNS = ("title", "date", "blog_name", "link", "full_text")
+
+# Tags that separate words, so "<p>one</p><p>two</p>" indexes as "one two"
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+}
+SKIP_TAGS = {"script", "style"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def strip_html(markup):
+    """The visible text of an HTML fragment, with whitespace collapsed"""
+    if not markup:
+        return ""
+    extractor = _TextExtractor()
+    extractor.feed(markup)
+    extractor.close()
+    return " ".join("".join(extractor.parts).split())
+
+
+def _create_posts_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS posts (title TEXT, date TEXT, blog_name TEXT, link TEXT, full_text TEXT)"
+    )
+
+
+def _unique_link_index(conn):
+    # Keep the first copy of any post that was inserted more than once.
+    # Posts without a link are left alone: GROUP BY would lump them
+    # together, but the unique index allows any number of NULLs.
+    deleted = conn.execute(
+        "DELETE FROM posts WHERE link IS NOT NULL AND rowid NOT IN "
+        "(SELECT MIN(rowid) FROM posts WHERE link IS NOT NULL GROUP BY link)"
+    ).rowcount
+    if deleted:
+        logging.info(f"Removed {deleted} duplicate posts")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS posts_link ON posts (link)")
+
+
+def _full_text_index(conn):
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+        "title, body, tokenize = 'porter unicode61 remove_diacritics 2')"
+    )
+    conn.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts (rowid, title, body)
+            VALUES (new.rowid, new.title, strip_html(new.full_text));
+        END;
+        CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+            DELETE FROM posts_fts WHERE rowid = old.rowid;
+        END;
+        CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE ON posts BEGIN
+            DELETE FROM posts_fts WHERE rowid = old.rowid;
+            INSERT INTO posts_fts (rowid, title, body)
+            VALUES (new.rowid, new.title, strip_html(new.full_text));
+        END;
+        """
+    )
+    conn.execute("DELETE FROM posts_fts")
+    conn.execute(
+        "INSERT INTO posts_fts (rowid, title, body) SELECT rowid, title, strip_html(full_text) FROM posts"
+    )
+
+
+def _full_text_pending(conn):
+    # Replace the triggers that called strip_html() with ones that only
+    # queue rows, so connections without the function can still write
+    conn.executescript(
+        """
+        DROP TRIGGER IF EXISTS posts_fts_insert;
+        DROP TRIGGER IF EXISTS posts_fts_update;
+        CREATE TABLE IF NOT EXISTS posts_fts_pending (post_rowid INTEGER PRIMARY KEY);
+        CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT OR IGNORE INTO posts_fts_pending (post_rowid) VALUES (new.rowid);
+        END;
+        CREATE TRIGGER posts_fts_update AFTER UPDATE ON posts BEGIN
+            DELETE FROM posts_fts WHERE rowid = old.rowid;
+            INSERT OR IGNORE INTO posts_fts_pending (post_rowid) VALUES (new.rowid);
+        END;
+        """
+    )
+
+
+def _published_on_column(conn):
+    # YYYYMMDD as an integer, derived from date by SQLite itself so it can
+    # never drift from it, and indexed for ordering and month bucketing
+    # (published_on / 100 is YYYYMM)
+    conn.execute(
+        "ALTER TABLE posts ADD COLUMN published_on INTEGER "
+        "GENERATED ALWAYS AS (CAST(replace(substr(date, 1, 10), '-', '') AS INTEGER)) VIRTUAL"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS posts_published_on ON posts (published_on)")
+
+
+# Applied in order; a database at user_version n has had the first n applied
+MIGRATIONS = [
+    _create_posts_table,
+    _unique_link_index,
+    _full_text_index,
+    _published_on_column,
+    _full_text_pending,
+]
+
+
+def migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logging.info(f"Migrating database to version {number}: {migration.__name__}")
+        with conn:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+
+def connect(db_path=DB_PATH):
+    """Open the database, migrating it to the current schema"""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.create_function("strip_html", 1, strip_html, deterministic=True)
+    # WAL lets readers carry on during writes and makes commits cheaper
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    migrate(conn)
+    # Catch up on posts written by clients that don't index them
+    with conn:
+        index_pending_posts(conn)
+    return conn
+
+
+def index_pending_posts(conn):
+    """
+    Index the posts queued in posts_fts_pending; the caller commits.
+
+    Returns:
+        int: The number of queued rows handled.
+    """
+    rowids = conn.execute("SELECT post_rowid FROM posts_fts_pending").fetchall()
+    if not rowids:
+        return 0
+    # Rows deleted since they were queued are simply dropped from the index
+    conn.executemany("DELETE FROM posts_fts WHERE rowid = ?", rowids)
+    rows = conn.execute(
+        """
+        SELECT posts.rowid, posts.title, posts.full_text
+        FROM posts JOIN posts_fts_pending ON posts.rowid = posts_fts_pending.post_rowid
+        """
+    ).fetchall()
+    conn.executemany(
+        "INSERT INTO posts_fts (rowid, title, body) VALUES (?, ?, ?)",
+        [(rowid, title, strip_html(full_text)) for rowid, title, full_text in rows],
+    )
+    conn.executemany("DELETE FROM posts_fts_pending WHERE post_rowid = ?", rowids)
+    return len(rowids)
+
+
+def upsert_posts(conn, rows, batch_size=BATCH_SIZE):
+    """
+    Insert or update posts, committing every batch_size rows.
+
+    Args:
+        conn: A connection from connect().
+        rows: Iterable of (title, date, blog_name, link, full_text) tuples;
+            may be a generator, rows are written as they arrive.
+        batch_size: Rows per transaction.
+
+    Returns:
+        int: The number of rows written.
+
+    Raises:
+        sqlite3.Error: If a batch fails; earlier batches stay committed.
+    """
+    updates = ", ".join(f"{column} = excluded.{column}" for column in POST_COLUMNS if column != "link")
+    sql = (
+        f"INSERT INTO posts ({', '.join(POST_COLUMNS)}) VALUES ({', '.join('?' * len(POST_COLUMNS))}) "
+        f"ON CONFLICT(link) DO UPDATE SET {updates}"
+    )
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with conn:
+                conn.executemany(sql, batch)
+                index_pending_posts(conn)
+            written += len(batch)
+            batch = []
+    if batch:
+        with conn:
+            conn.executemany(sql, batch)
+            index_pending_posts(conn)
+        written += len(batch)
+    return written
+
+
+def match_expression(query):
+    """
+    An FTS5 MATCH expression for a plain search: every word must appear,
+    and the last word may be a prefix ("sear" finds "search").
+    """
+    words = query.split()
+    if not words:
+        return None
+    terms = ['"' + word.replace('"', '""') + '"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_posts(conn, query, limit=20, raw=False):
+    """
+    Search posts by title and text, best matches first.
+
+    Args:
+        conn: A connection from connect().
+        query: Words to search for, or an FTS5 query if raw is True.
+        limit: Maximum number of results.
+        raw: Pass query to FTS5 as-is (phrases, OR, NEAR, column filters).
+
+    Returns:
+        list[dict]: title, date, blog_name, link, snippet (matches in
+        [brackets]) and rank (lower is better).
+    """
+    expression = query if raw else match_expression(query)
+    if not expression:
+        return []
+    rows = conn.execute(
+        """
+        SELECT posts.title, posts.date, posts.blog_name, posts.link,
+               snippet(posts_fts, 1, '[', ']', '...', 16),
+               bm25(posts_fts, 10.0, 1.0) AS rank
+        FROM posts_fts JOIN posts ON posts.rowid = posts_fts.rowid
+        WHERE posts_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+        """,
+        (expression, limit),
+    )
+    columns = ("title", "date", "blog_name", "link", "snippet", "rank")
+    return [dict(zip(columns, row)) for row in rows]
@@ -0,0 +1,314 @@
+"""
+Build the whole site with one command, rebuilding only what changed.
+
+The build is a graph of targets, each with the files it reads, the files
+it writes and the targets it depends on:
+
+    blog_posts.db                         -> archive (all-my-posts.html, search/)
+    source JPEGs in images/<gallery>/     -> derivatives:<gallery>
+    derivatives:<gallery> + config        -> gallery:<gallery> (index.html)
+    images in every gallery + config      -> master-gallery
+
+A target is rebuilt when the size or modification time of any of its
+inputs differs from its last successful build (kept in .build-state.json),
+when one of its outputs is missing, or when a dependency was rebuilt.
+Gallery targets are left alone in a checkout without the photos, and the
+master page unless every gallery's photos are there, so the committed
+pages are not replaced with empty ones. Targets whose
+dependencies are done run in parallel, each as its own process, and a
+timing table is printed at the end.
+
+    python scripts/build_site.py                  # build everything that is dirty
+    python scripts/build_site.py gallery:2025-ff-cologne
+    python scripts/build_site.py --dry-run        # show what would be rebuilt
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Get the base directory of the script
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+IMAGES_DIR = os.path.join(ROOT_DIR, "images")
+GALLERY_CONFIG = os.path.join(IMAGES_DIR, "gallery-config.md")
+DB_PATH = os.path.join(ROOT_DIR, "data/blog_posts.db")
+# Input signatures of each target's last successful build
+STATE_PATH = os.path.join(ROOT_DIR, ".build-state.json")
+
+DEFAULT_JOBS = os.cpu_count() or 1
+
+sys.path.insert(0, IMAGES_DIR)
+from generate_ff_galleries import GalleryConfig, GalleryGenerator  # noqa: E402
+from generate_resized_images import MANIFEST_NAME, find_images  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class Target:
+    """
+    One node of the build graph.
+
+    inputs is a function returning the files the target reads, evaluated
+    when the target is about to run, so it sees what its dependencies
+    wrote. extra_args are appended to the command but left out of the
+    signature, for options that don't change the outputs (like --jobs).
+    If has_sources returns False there is nothing to build from, and the
+    target is not run.
+    """
+
+    def __init__(self, name, command, inputs, outputs=(), deps=(), extra_args=(), has_sources=None):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.extra_args = list(extra_args)
+        self.has_sources = has_sources or (lambda: True)
+
+    def signature(self):
+        """A hash of the command and of every input's path, size and mtime"""
+        digest = hashlib.sha256(json.dumps(self.command).encode("utf-8"))
+        for path in sorted(set(self.inputs())):
+            try:
+                stat = os.stat(path)
+                stamp = [os.path.relpath(path, ROOT_DIR), stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                stamp = [os.path.relpath(path, ROOT_DIR), None, None]
+            digest.update(json.dumps(stamp).encode("utf-8"))
+        return digest.hexdigest()
+
+    def missing_outputs(self):
+        return [path for path in self.outputs if not os.path.exists(path)]
+
+
+def _script(*parts):
+    return os.path.join(ROOT_DIR, *parts)
+
+
+def gallery_sources(directory):
+    """The source JPEGs of a gallery, as generate_resized_images.py finds them"""
+    gallery_dir = os.path.join(IMAGES_DIR, directory)
+    return find_images(gallery_dir) if os.path.isdir(gallery_dir) else []
+
+
+def gallery_images(directory):
+    """Every image a gallery page lists, as generate_ff_galleries.py finds them"""
+    names = GalleryGenerator(IMAGES_DIR).get_image_files(directory)
+    return [os.path.join(IMAGES_DIR, directory, name) for name in names]
+
+
+def build_graph(jobs=DEFAULT_JOBS):
+    """
+    Every target in the site, keyed by name.
+
+    jobs is the build's parallelism: each derivatives target may run
+    alongside the others, so each gets a share of it for its own process
+    pool rather than a pool per CPU.
+    """
+    python = sys.executable
+    resize_script = _script("images", "generate_resized_images.py")
+    gallery_script = _script("images", "generate_ff_galleries.py")
+    targets = {}
+
+    def add(target):
+        targets[target.name] = target
+
+    archive_scripts = [
+        _script("scripts", name)
+        for name in ("gen_html_index_page.py", "search_index.py", "blog_db.py")
+    ]
+    add(Target(
+        "archive",
+        [python, _script("scripts", "gen_html_index_page.py")],
+        inputs=lambda: [DB_PATH, DB_PATH + "-wal"] + archive_scripts,
+        outputs=[_script("all-my-posts.html"), _script("search", "manifest.json")],
+    ))
+
+    galleries = GalleryConfig(GALLERY_CONFIG).galleries
+    resize_jobs = str(max(1, jobs // max(1, len(galleries))))
+    for gallery in galleries:
+        directory = gallery["directory"]
+        gallery_dir = os.path.join(IMAGES_DIR, directory)
+        manifest = os.path.join(gallery_dir, MANIFEST_NAME)
+        add(Target(
+            f"derivatives:{directory}",
+            [python, resize_script, gallery_dir],
+            inputs=lambda directory=directory: gallery_sources(directory) + [resize_script],
+            outputs=[manifest],
+            extra_args=["--jobs", resize_jobs],
+            has_sources=lambda directory=directory: bool(gallery_sources(directory)),
+        ))
+        # The page lists the images and the derivatives the manifest records
+        add(Target(
+            f"gallery:{directory}",
+            [python, gallery_script, IMAGES_DIR, "--gallery", directory, "--no-master"],
+            inputs=lambda directory=directory, manifest=manifest: (
+                gallery_images(directory) + [manifest, GALLERY_CONFIG, gallery_script, resize_script]
+            ),
+            outputs=[os.path.join(gallery_dir, "index.html")],
+            deps=[f"derivatives:{directory}"],
+            has_sources=lambda directory=directory: bool(gallery_images(directory)),
+        ))
+
+    # The master page only needs the config and each gallery's image count.
+    # A gallery without its photos here would be listed as "Coming soon",
+    # so only build it when every gallery's photos are present.
+    add(Target(
+        "master-gallery",
+        [python, gallery_script, IMAGES_DIR, "--master-only"],
+        inputs=lambda: [
+            path for gallery in galleries for path in gallery_images(gallery["directory"])
+        ] + [GALLERY_CONFIG, gallery_script],
+        outputs=[os.path.join(IMAGES_DIR, "master-gallery.html")],
+        has_sources=lambda: all(gallery_images(gallery["directory"]) for gallery in galleries),
+    ))
+    return targets
+
+
+def load_state():
+    try:
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    tmp_path = STATE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def select(targets, names):
+    """The named targets and everything they depend on"""
+    selected = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(targets[name].deps)
+    return selected
+
+
+def run_target(target):
+    """Run a target's command; returns (ok, seconds, output)"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        target.command + target.extra_args, cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    return result.returncode == 0, time.perf_counter() - started, result.stdout
+
+
+def build(targets, names, jobs=DEFAULT_JOBS, force=False, dry_run=False):
+    """
+    Bring the named targets (and their dependencies) up to date.
+
+    Returns:
+        dict: target name -> (status, seconds), where status is "built",
+        "up to date", "no sources" (nothing to build from), "failed",
+        "skipped" (a dependency failed) or, with dry_run, "would build".
+    """
+    state = load_state()
+    waiting = select(targets, names)
+    results = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while waiting or running:
+            # Start (or settle) every target whose dependencies are finished
+            for name in sorted(waiting):
+                target = targets[name]
+                if any(dep not in results for dep in target.deps):
+                    continue
+                waiting.discard(name)
+                dep_statuses = {results[dep][0] for dep in target.deps}
+                if dep_statuses & {"failed", "skipped"}:
+                    results[name] = ("skipped", 0.0)
+                    continue
+                if not target.has_sources():
+                    results[name] = ("no sources", 0.0)
+                    continue
+                signature = target.signature()
+                dirty = (
+                    force
+                    or state.get(name) != signature
+                    or target.missing_outputs()
+                    or dep_statuses & {"built", "would build"}
+                )
+                if not dirty:
+                    results[name] = ("up to date", 0.0)
+                elif dry_run:
+                    results[name] = ("would build", 0.0)
+                else:
+                    logging.info(f"Building {name}")
+                    running[executor.submit(run_target, target)] = (name, signature)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, signature = running.pop(future)
+                ok, seconds, output = future.result()
+                if ok:
+                    results[name] = ("built", seconds)
+                    state[name] = signature
+                    save_state(state)
+                    logging.info(f"Built {name} in {seconds:.2f}s")
+                else:
+                    results[name] = ("failed", seconds)
+                    state.pop(name, None)
+                    save_state(state)
+                    logging.error(f"{name} failed:\n{output.rstrip()}")
+    return results
+
+
+def print_timings(results, elapsed):
+    width = max([len(name) for name in results] + [len("target")])
+    print(f"{'target':<{width}}  {'status':<11}  {'seconds':>8}")
+    for name in sorted(results):
+        status, seconds = results[name]
+        print(f"{name:<{width}}  {status:<11}  {seconds:>8.2f}")
+    print(f"{'total (wall clock)':<{width}}  {'':<11}  {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("targets", nargs="*", help="targets to build (default: all)")
+    arg_parser.add_argument(
+        "-j", "--jobs", type=int, default=DEFAULT_JOBS,
+        help=f"targets to run at once (default: {DEFAULT_JOBS})",
+    )
+    arg_parser.add_argument("--force", action="store_true", help="rebuild targets even if they are up to date")
+    arg_parser.add_argument("--dry-run", action="store_true", help="show what would be rebuilt")
+    arg_parser.add_argument("--list", action="store_true", help="list the targets and their dependencies")
+    args = arg_parser.parse_args()
+
+    if args.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+    targets = build_graph(args.jobs)
+    if args.list:
+        for name in sorted(targets):
+            deps = ", ".join(targets[name].deps)
+            print(f"{name}" + (f"  <- {deps}" if deps else ""))
+        sys.exit(0)
+
+    unknown = [name for name in args.targets if name not in targets]
+    if unknown:
+        arg_parser.error(f"unknown target(s): {', '.join(unknown)} (see --list)")
+
+    started = time.perf_counter()
+    results = build(targets, args.targets or list(targets), args.jobs, args.force, args.dry_run)
+    print_timings(results, time.perf_counter() - started)
+    if any(status in ("failed", "skipped") for status, _ in results.values()):
+        sys.exit(1)
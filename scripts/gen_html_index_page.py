@@ -1,55 +1,44 @@
-import sqlite3
+import argparse
 from datetime import datetime
 from collections import defaultdict
 import subprocess
+import hashlib
+import json
 import logging
 import os
 
+import blog_db
+from atomic_write import write_atomic
+from search_index import INDEX_VERSION, SEARCH_SCRIPT, build_search_index
+
 # Get the base directory of the script
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Path to the database
 DB_PATH = os.path.join(BASE_DIR, "../data/blog_posts.db")
 # Path to the output file
 FILE_PATH = os.path.join(BASE_DIR, "../all-my-posts.html")
+# Directory for the search index, which the page loads from search/
+SEARCH_DIR = os.path.join(BASE_DIR, "../search")
+# Directory for the per-year or per-N-posts pages in split mode
+ARCHIVE_DIR = os.path.join(BASE_DIR, "../archive")
 
-logging.basicConfig(level=logging.INFO)
-
-# Connect to the SQLite database
-conn = sqlite3.connect(DB_PATH)
-
-
-# Query the database
-query = """
-SELECT title, date, blog_name, link 
-FROM posts 
-ORDER BY date DESC;
-"""
-cursor = conn.cursor()
-cursor.execute(query)
-
-# Fetch and organize posts
-posts = cursor.fetchall()  # List of tuples: (title, date, blog_name, link)
-grouped_posts = defaultdict(list)
+TITLE = "Blog Posts Archive"
 
-# Group posts by month and year
-for title, date, blog_name, link in posts:
-    post_date = datetime.strptime(date, "%Y-%m-%d")  # Parse date string to datetime
-    month_year = post_date.strftime("%B %Y")
-    grouped_posts[month_year].append((title, post_date, blog_name, link))
+# For month headings; fixed rather than from the locale, like the rest of the page
+MONTH_NAMES = (
+    None, "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+)
 
-# Close the database connection
-conn.close()
-
-# Get the last updated date
-last_updated_date = datetime.now().strftime("%Y-%m-%d")
+logging.basicConfig(level=logging.INFO)
 
-# Generate HTML
-html_content = f"""<!DOCTYPE html>
+# Everything up to the first month heading; filled in with str.format
+PAGE_HEAD = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Blog Posts Archive</title>
+    <title>{title}</title>
     <style>
         body {{
             font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Oxygen-Sans, Ubuntu, Cantarell, "Helvetica Neue", sans-serif;
@@ -117,40 +106,307 @@ html_content = f"""<!DOCTYPE html>
         .year-nav a:hover {{
             text-decoration: underline;
         }}
+        .search {{
+            margin-bottom: 2rem;
+        }}
+        .search input {{
+            width: 100%;
+            box-sizing: border-box;
+            padding: 0.5rem;
+            font: inherit;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+        }}
+        .search .post-list {{
+            margin-top: 1rem;
+        }}
     </style>
 </head>
 <body>
-    <h1>Blog Posts Archive</h1>
+    <h1>{title}</h1>
     <div class="last-updated">Last Updated: {last_updated_date}</div>
+{nav}    <div class="search">
+        <input type="search" id="search-input" placeholder="Search all posts" aria-label="Search all posts" autocomplete="off" data-index="{search_url}">
+        <ol id="search-results" class="post-list"></ol>
+    </div>
     <ul class="post-list">
 """
 
-for month_year, posts in grouped_posts.items():
-    # Add month heading with year included in the ID
-    html_content += f'<h2 class="month-heading" id="{month_year.replace(" ", "_")}">{month_year}</h2>\n'
-    for title, post_date, blog_name, link in posts:
-        formatted_date = post_date.strftime("%Y-%m-%d")
-        html_content += f"""
+
+def iter_posts(db_path=DB_PATH):
+    """
+    Posts as (title, date, blog_name, link, month), newest first, read as
+    they are needed. date is formatted for display and month is the
+    post's YYYYMM, both worked out in SQL from the indexed published_on.
+    """
+    # Connect to the SQLite database
+    conn = blog_db.connect(db_path)
+    try:
+        # Query the database; the year is unpadded, as strftime("%Y") gives on
+        # Linux, and posts from the same day stay in the order they were added
+        query = """
+SELECT title, CAST(published_on / 10000 AS TEXT) || substr(date, 5, 6), blog_name, link, published_on / 100
+FROM posts 
+ORDER BY published_on DESC, rowid;
+"""
+        yield from conn.execute(query)
+    finally:
+        # Close the database connection
+        conn.close()
+
+
+def fetch_posts(db_path=DB_PATH):
+    """All posts as (title, date, blog_name, link, month), newest first"""
+    return list(iter_posts(db_path))
+
+
+def month_label(month):
+    """ "Month Year" for a YYYYMM bucket"""
+    return f"{MONTH_NAMES[month % 100]} {month // 100}"
+
+
+def iter_months(posts):
+    """
+    Group posts (newest first) into ("Month Year", posts) pairs, one month
+    at a time, so only the current month is held in memory.
+    """
+    month_posts = []
+    current = None
+    for title, date, blog_name, link, month in posts:
+        if month != current and month_posts:
+            yield month_label(current), month_posts
+            month_posts = []
+        current = month
+        month_posts.append((title, date, blog_name, link))
+    if month_posts:
+        yield month_label(current), month_posts
+
+
+def group_posts_by_month(posts):
+    """Posts keyed by "Month Year", in the order given"""
+    grouped_posts = defaultdict(list)
+
+    # Group posts by month and year
+    for month_year, month_posts in iter_months(posts):
+        grouped_posts[month_year].extend(month_posts)
+    return grouped_posts
+
+
+def split_posts(posts, split):
+    """
+    Split posts (newest first) into pages.
+
+    Args:
+        posts: Rows from fetch_posts.
+        split: "year" for a page per year, or a number of posts per page.
+
+    Returns:
+        list: (name, label, posts) per page, newest first; name is the page's
+        file name without extension.
+    """
+    pages = []
+    if split == "year":
+        for post in posts:
+            year = post[-1] // 100
+            name = f"{year:04d}"
+            if not pages or pages[-1][0] != name:
+                pages.append((name, str(year), []))
+            pages[-1][2].append(post)
+    else:
+        for start in range(0, len(posts), split):
+            number = start // split + 1
+            pages.append((f"page-{number}", str(number), posts[start : start + split]))
+    return pages
+
+
+def render_nav(pages, current, prefix, index_href):
+    """The year-nav links between split pages; the first page is the index"""
+    links = []
+    for position, (name, label, _) in enumerate(pages):
+        href = index_href if position == 0 else f"{prefix}{name}.html"
+        if name == current:
+            links.append(f'<a href="{href}" aria-current="page"><strong>{label}</strong></a>')
+        else:
+            links.append(f'<a href="{href}">{label}</a>')
+    return f'    <nav class="year-nav">{" ".join(links)}</nav>\n'
+
+
+def render_archive_parts(months, last_updated_date, title=TITLE, nav="", search_url="search/"):
+    """The archive page's HTML in pieces: the head, each month, then the end"""
+    yield PAGE_HEAD.format(
+        last_updated_date=last_updated_date, title=title, nav=nav, search_url=search_url
+    )
+
+    for month_year, posts in months:
+        # Add month heading with year included in the ID
+        parts = [f'<h2 class="month-heading" id="{month_year.replace(" ", "_")}">{month_year}</h2>\n']
+        for post_title, formatted_date, blog_name, link in posts:
+            parts.append(f"""
         <li class="post-item">
             <span class="post-date">{formatted_date}</span>
-            <a href="{link}" class="post-title">{title}</a>
+            <a href="{link}" class="post-title">{post_title}</a>
             <span class="post-blog">— {blog_name}</span>
         </li>
-        """
+        """)
+        yield "".join(parts)
 
-html_content += """
+    yield """
     </ul>
-</body>
+""" + SEARCH_SCRIPT + """</body>
 </html>
 """
 
-# Write to a static HTML file
-# Write the HTML content to the file
-with open(FILE_PATH, "w", encoding="utf-8") as f:
-    f.write(html_content)
 
-logging.info(f"Working directory: {os.getcwd()}")
-logging.info(f"HTML file generated: {FILE_PATH}")
+def render_archive(grouped_posts, last_updated_date, **options):
+    """The archive page's HTML"""
+    return "".join(render_archive_parts(grouped_posts.items(), last_updated_date, **options))
+
+
+def write_archive(file_path, parts):
+    """
+    Stream the pieces of a page into a temporary file beside file_path, then
+    rename it into place, so readers never see a partly written page.
+    """
+    write_atomic(file_path, parts)
+
+
+def write_split_archive(posts, split, last_updated_date, file_path, archive_dir, search_dir):
+    """
+    Write a page per year (or per split posts) into archive_dir, and an
+    index at file_path holding the newest page, so the index stays the same
+    size however large the archive grows.
+    """
+    pages = split_posts(posts, split)
+    os.makedirs(archive_dir, exist_ok=True)
+    index_dir = os.path.dirname(os.path.abspath(file_path))
+    archive_prefix = os.path.relpath(archive_dir, index_dir).replace(os.sep, "/") + "/"
+    from_archive = os.path.relpath(index_dir, archive_dir).replace(os.sep, "/") + "/"
+    index_name = os.path.basename(file_path)
+    search_url = os.path.relpath(search_dir, index_dir).replace(os.sep, "/") + "/"
+
+    written = set()
+    for name, label, page_posts in pages:
+        nav = render_nav(pages, name, "", from_archive + index_name)
+        parts = render_archive_parts(
+            iter_months(page_posts),
+            last_updated_date,
+            title=f"{TITLE}: {label}",
+            nav=nav,
+            search_url=from_archive + search_url,
+        )
+        write_archive(os.path.join(archive_dir, f"{name}.html"), parts)
+        written.add(f"{name}.html")
+
+    # Remove pages left over from a previous split
+    for filename in os.listdir(archive_dir):
+        if filename.endswith(".html") and filename not in written:
+            os.remove(os.path.join(archive_dir, filename))
+
+    newest = pages[0][2] if pages else []
+    nav = render_nav(pages, pages[0][0], archive_prefix, index_name) if pages else ""
+    parts = render_archive_parts(iter_months(newest), last_updated_date, nav=nav, search_url=search_url)
+    write_archive(file_path, parts)
+    logging.info(f"{len(pages)} archive pages generated in {archive_dir}")
+
+
+def fingerprint_path(file_path):
+    """Where the fingerprint of the last generated archive is kept"""
+    return os.path.splitext(file_path)[0] + ".fingerprint"
+
+
+def archive_fingerprint(db_path, split=None):
+    """
+    A hash of everything the archive and search index are built from: the
+    posts (including their text, for the index), the page templates and
+    the output mode. The Last Updated date is deliberately left out.
+    """
+    digest = hashlib.sha256()
+    settings = {"split": split, "index_version": INDEX_VERSION}
+    digest.update(json.dumps(settings).encode("utf-8"))
+    digest.update(PAGE_HEAD.encode("utf-8"))
+    digest.update(SEARCH_SCRIPT.encode("utf-8"))
+    conn = blog_db.connect(db_path)
+    try:
+        rows = conn.execute("SELECT title, date, blog_name, link, full_text FROM posts ORDER BY rowid")
+        for row in rows:
+            digest.update(json.dumps(row).encode("utf-8"))
+    finally:
+        conn.close()
+    return digest.hexdigest()
+
+
+def read_fingerprint(file_path):
+    try:
+        with open(fingerprint_path(file_path), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def main(
+    db_path=DB_PATH,
+    file_path=FILE_PATH,
+    search_dir=SEARCH_DIR,
+    split=None,
+    archive_dir=ARCHIVE_DIR,
+    force=False,
+):
+    """Regenerate the archive; returns False if it was already up to date"""
+    # Skip the whole run, leaving every file untouched, if nothing has changed
+    fingerprint = archive_fingerprint(db_path, split)
+    if not force and os.path.exists(file_path) and read_fingerprint(file_path) == fingerprint:
+        logging.info(f"Posts unchanged since {file_path} was generated, skipping")
+        return False
+
+    # Get the last updated date
+    last_updated_date = datetime.now().strftime("%Y-%m-%d")
+
+    if split:
+        posts = fetch_posts(db_path)
+        write_split_archive(posts, split, last_updated_date, file_path, archive_dir, search_dir)
+    else:
+        # Stream each month to disk as it is read, rather than building the page in memory
+        parts = render_archive_parts(iter_months(iter_posts(db_path)), last_updated_date)
+        write_archive(file_path, parts)
+
+    logging.info(f"Working directory: {os.getcwd()}")
+    logging.info(f"HTML file generated: {file_path}")
+
+    build_search_index(search_dir, db_path)
+
+    # Written last, so an interrupted run is redone next time
+    write_archive(fingerprint_path(file_path), [fingerprint + "\n"])
+    return True
+
+
+def split_arg(value):
+    if value == "year":
+        return value
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise argparse.ArgumentTypeError("must be 'year' or a positive number of posts")
+    return size
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generate the blog posts archive page")
+    arg_parser.add_argument(
+        "--split",
+        type=split_arg,
+        metavar="year|N",
+        help="write a page per year or per N posts into archive/, with the newest "
+        "page and year-nav links in the main archive page",
+    )
+    arg_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="regenerate even if the posts have not changed since the last run",
+    )
+    args = arg_parser.parse_args()
+    main(split=args.split, force=args.force)
 
 
 # # lets see if local git changes work.
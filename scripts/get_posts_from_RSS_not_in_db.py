@@ -5,48 +5,101 @@ The RSS feed is https://world.hey.com/ian.mulvany/feed.atom
 The database is blog_posts.db
 
 Return a list of posts that are not in the database. 
+
+The feed's ETag/Last-Modified and newest entry id are kept in
+feed_state.json, so an unchanged feed costs a 304 and only entries newer
+than the last one seen are checked against the database.
 """
 
 import feedparser
-import sqlite3
+import json
+import logging
 import os
 
+import blog_db
+
 # Get the base directory of the script
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Path to the database
 DB_PATH = os.path.join(BASE_DIR, "../data/blog_posts.db")
+# Path to the saved feed validators and newest-seen entry
+FEED_STATE_PATH = os.path.join(BASE_DIR, "../data/feed_state.json")
 
+FEED_URL = "https://world.hey.com/ian.mulvany/feed.atom"
 
-def get_missing_posts():
-    # Load the RSS feed
-    feed = feedparser.parse("https://world.hey.com/ian.mulvany/feed.atom")
+# State from the last get_missing_posts call, written by save_feed_state
+# once the missing posts have been stored
+_pending_state = None
+
+
+def load_feed_state():
+    try:
+        with open(FEED_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_feed_state():
+    """
+    Persist the feed state seen by the last get_missing_posts call.
+
+    Only call this after the missing posts are in the database; otherwise
+    the next run would skip them as already seen.
+    """
+    if _pending_state is None:
+        return
+    os.makedirs(os.path.dirname(FEED_STATE_PATH), exist_ok=True)
+    tmp_path = FEED_STATE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_pending_state, f, indent=2)
+    os.replace(tmp_path, FEED_STATE_PATH)
 
-    # Connect to the database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
-    # Fetch all posts from the database
-    cursor.execute(
-        "SELECT title, date, blog_name, link FROM posts WHERE blog_name = 'hey'"
+def get_missing_posts(incremental=True):
+    global _pending_state
+    state = load_feed_state() if incremental else {}
+
+    # Load the RSS feed, conditionally if we have validators from last time
+    feed = feedparser.parse(
+        FEED_URL, etag=state.get("etag"), modified=state.get("modified")
     )
-    posts = cursor.fetchall()
+    if feed.get("status") == 304:
+        logging.info("Feed not modified since last run")
+        _pending_state = None
+        return []
 
-    # Compare the feed items to the posts in the database, and keep track of the ones that are not in the database
-    missing_posts = []
+    # Entries are newest first; anything from the newest id seen last time
+    # onwards is already known
+    new_entries = []
     for item in feed.entries:
-        title = item.title
-        date = item.published
-        link = item.link
-
-        # Check if the post exists in the database based only on the link
-        cursor.execute(
-            "SELECT COUNT(*) FROM posts WHERE link = ?",
-            (link,),
-        )
-        count = cursor.fetchone()[0]
+        if state.get("newest_id") and item.get("id") == state["newest_id"]:
+            break
+        new_entries.append(item)
+
+    _pending_state = {
+        "etag": feed.get("etag"),
+        "modified": feed.get("modified"),
+        "newest_id": feed.entries[0].get("id") if feed.entries else state.get("newest_id"),
+    }
+
+    if not new_entries:
+        return []
 
-        if count == 0:
-            missing_posts.append(item)
+    # Connect to the database
+    conn = blog_db.connect(DB_PATH)
+
+    # Look up all the feed links in one query (posts.link has a unique index),
+    # and keep the entries whose link is not in the database
+    links = [item.link for item in new_entries]
+    placeholders = ", ".join("?" * len(links))
+    known_links = {
+        row[0]
+        for row in conn.execute(
+            f"SELECT link FROM posts WHERE link IN ({placeholders})", links
+        )
+    }
+    missing_posts = [item for item in new_entries if item.link not in known_links]
 
     # Close the database connection
     conn.close()
@@ -0,0 +1,312 @@
+"""
+Streaming ingest of new Hey posts: feed diff -> fetch -> parse -> write.
+
+The stages run concurrently and hand work on through bounded queues, so
+BeautifulSoup extraction (on a process pool) overlaps with downloading,
+and a slow stage applies back-pressure instead of letting lists of pages
+pile up in memory:
+
+    feed diff  --fetch queue-->  fetchers (threads)
+               --parse queue-->  parsers (processes)
+               --write queue-->  single writer (batched upserts)
+
+Per-stage counters (items, busy time, throughput, peak queue depth) are
+logged while it runs and summarised at the end.
+"""
+
+import argparse
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+import blog_db
+from get_posts_from_RSS_not_in_db import get_missing_posts, save_feed_state
+from insert_missing_hey_rss_posts_into_db import DB_PATH, post_row
+from scrape_hey_blog_page_content import (
+    DEFAULT_CONCURRENCY,
+    MIN_HOST_INTERVAL,
+    HostRateLimiter,
+    download_page,
+    get_session,
+    extract_blog_content,
+    fetch_error_content,
+)
+
+QUEUE_SIZE = 16  # items each queue holds before its producer blocks
+PROGRESS_INTERVAL = 5.0  # seconds between progress log lines
+
+STAGES = ("feed", "fetch", "parse", "write")
+
+# Marks the end of a queue's input
+_DONE = None
+
+
+class StageStats:
+    """Counters for one pipeline stage. Safe to share between threads."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.items = 0
+        self.busy = 0.0  # seconds spent working, summed over workers
+        self.max_queue_depth = 0  # of the queue this stage feeds
+
+    def record(self, seconds, items=1):
+        with self.lock:
+            self.items += items
+            self.busy += seconds
+
+    def put(self, out_queue, item):
+        """Put item on this stage's output queue, tracking its depth"""
+        out_queue.put(item)
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, out_queue.qsize())
+
+    def summary(self, elapsed):
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "items_per_sec": round(self.items / elapsed, 2) if elapsed else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+def extraction_error_content(error):
+    """The HTML stored in place of a post's content when extraction fails"""
+    return f"<div>Error extracting the content: {error}</div>"
+
+
+def _timed_extract(html):
+    """extract_blog_content plus its run time, for the process pool"""
+    started = time.perf_counter()
+    content = extract_blog_content(html)
+    return content, time.perf_counter() - started
+
+
+def run_pipeline(
+    posts,
+    fetchers=DEFAULT_CONCURRENCY,
+    parsers=None,
+    queue_size=QUEUE_SIZE,
+    batch_size=blog_db.BATCH_SIZE,
+    db_path=DB_PATH,
+    min_host_interval=MIN_HOST_INTERVAL,
+):
+    """
+    Fetch, parse and store the given feed entries.
+
+    Args:
+        posts: Iterable of feed entries (with title, published and link).
+        fetchers: Download threads.
+        parsers: Extraction processes (default: one per CPU).
+        queue_size: Capacity of each queue between stages.
+        batch_size: Posts per database transaction.
+        db_path: Database to write to.
+        min_host_interval: Average seconds between requests to one host.
+
+    Returns:
+        tuple: (ok, stats) where ok is False if any write failed, and stats
+        maps each stage name to its counters.
+    """
+    parsers = parsers or os.cpu_count() or 1
+    stats = {name: StageStats(name) for name in STAGES}
+    fetch_queue = queue.Queue(queue_size)
+    parse_queue = queue.Queue(queue_size)
+    write_queue = queue.Queue(queue_size)
+    rate_limiter = HostRateLimiter(min_host_interval, burst=fetchers)
+    get_session(fetchers)
+    queues = {"fetch": fetch_queue, "parse": parse_queue, "write": write_queue}
+
+    def feed():
+        try:
+            for post in posts:
+                stats["feed"].record(0.0)
+                stats["feed"].put(fetch_queue, post)
+        finally:
+            for _ in range(fetchers):
+                fetch_queue.put(_DONE)
+
+    def fetch():
+        try:
+            while (post := fetch_queue.get()) is not _DONE:
+                started = time.perf_counter()
+                try:
+                    html, error = download_page(post.link, rate_limiter=rate_limiter), None
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"Error fetching the URL: {e}")
+                    html, error = None, fetch_error_content(e)
+                except Exception as e:
+                    # Anything else is stored the same way, so one bad page
+                    # cannot stop this fetcher and stall the feed
+                    logging.exception(f"Unexpected error fetching {post.link}")
+                    html, error = None, fetch_error_content(e)
+                stats["fetch"].record(time.perf_counter() - started)
+                stats["fetch"].put(parse_queue, (post, html, error))
+        finally:
+            parse_queue.put(_DONE)
+
+    def parse(executor):
+        # Keep at most two pages per process in flight, oldest first
+        pending = deque()
+        finished_fetchers = 0
+
+        def finish_oldest():
+            post, future = pending.popleft()
+            try:
+                content, seconds = future.result()
+            except Exception as e:
+                # An extractor error, or a broken process pool
+                logging.error(f"Error extracting the content of {post.link}: {e}")
+                content, seconds = extraction_error_content(e), 0.0
+            stats["parse"].record(seconds)
+            stats["parse"].put(write_queue, (post, content))
+
+        try:
+            while finished_fetchers < fetchers:
+                item = parse_queue.get()
+                if item is _DONE:
+                    finished_fetchers += 1
+                    continue
+                post, html, error = item
+                if error is not None:
+                    stats["parse"].put(write_queue, (post, error))
+                    continue
+                if len(pending) >= parsers * 2:
+                    finish_oldest()
+                try:
+                    future = executor.submit(_timed_extract, html)
+                except Exception as e:
+                    logging.error(f"Error extracting the content of {post.link}: {e}")
+                    stats["parse"].put(write_queue, (post, extraction_error_content(e)))
+                    continue
+                pending.append((post, future))
+            while pending:
+                finish_oldest()
+        finally:
+            # If parsing failed, drain its queue so the fetchers can finish
+            while finished_fetchers < fetchers:
+                if parse_queue.get() is _DONE:
+                    finished_fetchers += 1
+            write_queue.put(_DONE)
+
+    def log_progress(stop):
+        while not stop.wait(PROGRESS_INTERVAL):
+            depths = ", ".join(f"{name} queue {q.qsize()}" for name, q in queues.items())
+            done = ", ".join(f"{name} {stats[name].items}" for name in STAGES)
+            logging.info(f"Progress: {done} ({depths})")
+
+    started = time.perf_counter()
+    ok = True
+    stop = threading.Event()
+    # The writer runs on this thread, as the single database connection.
+    # Open it before any stage starts, so a database that can't be opened
+    # fails here rather than leaving the stages blocked on full queues.
+    conn = blog_db.connect(db_path)
+    with ProcessPoolExecutor(max_workers=parsers) as executor:
+        threads = [threading.Thread(target=feed, name="feed")]
+        threads += [threading.Thread(target=fetch, name=f"fetch-{n}") for n in range(fetchers)]
+        threads += [threading.Thread(target=parse, args=(executor,), name="parse")]
+        threads += [threading.Thread(target=log_progress, args=(stop,), name="progress", daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        finished = False
+        try:
+            batch = []
+            while True:
+                item = write_queue.get()
+                if item is not _DONE:
+                    post, content = item
+                    batch.append(post_row(post, content))
+                if batch and (len(batch) >= batch_size or item is _DONE):
+                    write_started = time.perf_counter()
+                    try:
+                        blog_db.upsert_posts(conn, batch, batch_size)
+                    except sqlite3.Error as e:
+                        logging.error(f"Error inserting posts into database: {e}")
+                        ok = False
+                    stats["write"].record(time.perf_counter() - write_started, len(batch))
+                    batch = []
+                if item is _DONE:
+                    finished = True
+                    break
+        finally:
+            conn.close()
+            # If the writer failed, drain its queue so the other stages can finish
+            while not finished:
+                finished = write_queue.get() is _DONE
+            stop.set()
+            for thread in threads[:-1]:
+                thread.join()
+
+    elapsed = time.perf_counter() - started
+    summary = {name: stats[name].summary(elapsed) for name in STAGES}
+    logging.info(f"Pipeline finished in {elapsed:.2f}s")
+    for name, counters in summary.items():
+        logging.info(
+            f"  {name:<6} {counters['items']:>5} items  {counters['busy_seconds']:>8.3f}s busy  "
+            f"{counters['items_per_sec']:>7.2f}/s  max queue {counters['max_queue_depth']}"
+        )
+    return ok, summary
+
+
+def ingest_missing_posts(**options):
+    """Run the pipeline over the posts missing from the database"""
+    missing_posts = get_missing_posts()
+    logging.info(f"Found {len(missing_posts)} missing posts")
+    ok = True
+    if missing_posts:
+        ok, _ = run_pipeline(missing_posts, **options)
+    # Only remember the feed as seen if every new post made it in
+    if ok:
+        save_feed_state()
+    return ok
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument(
+        "--fetchers",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"download threads (default: {DEFAULT_CONCURRENCY})",
+    )
+    arg_parser.add_argument(
+        "--parsers", type=int, help="extraction processes (default: one per CPU)"
+    )
+    arg_parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=QUEUE_SIZE,
+        help=f"capacity of each queue between stages (default: {QUEUE_SIZE})",
+    )
+    arg_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=blog_db.BATCH_SIZE,
+        help=f"posts per database transaction (default: {blog_db.BATCH_SIZE})",
+    )
+    arg_parser.add_argument(
+        "--min-host-interval",
+        type=float,
+        default=MIN_HOST_INTERVAL,
+        help=f"average seconds between requests to one host (default: {MIN_HOST_INTERVAL})",
+    )
+    args = arg_parser.parse_args()
+    ok = ingest_missing_posts(
+        fetchers=args.fetchers,
+        parsers=args.parsers,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        min_host_interval=args.min_host_interval,
+    )
+    # Fail the workflow step, rather than committing a partial ingest
+    sys.exit(0 if ok else 1)
@@ -4,21 +4,26 @@ and the fetch_blog_content function from scrape_hey_blog_page_content.py,
 insert the missing posts into the database.
 """
 
+import argparse
 import sqlite3
 import time
 import logging
 from datetime import datetime
-from scrape_hey_blog_page_content import fetch_blog_content
-from get_posts_from_RSS_not_in_db import get_missing_posts
+import blog_db
+from scrape_hey_blog_page_content import DEFAULT_CONCURRENCY, MIN_HOST_INTERVAL, fetch_blog_contents
+from get_posts_from_RSS_not_in_db import get_missing_posts, save_feed_state
 from datetime import datetime
 from dateutil import parser
 import os
+import re
 
 # Get the base directory of the script
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Path to the database
 DB_PATH = os.path.join(BASE_DIR, "../data/blog_posts.db")
 
+ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}(T|$)")
+
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -39,6 +44,10 @@ def prepare_date(date_str):
     Raises:
         ValueError: If the input date cannot be parsed.
     """
+    # Atom dates are RFC 3339 and already start with the date (in the
+    # post's own timezone, as dateutil would give), so skip parsing them
+    if ISO_DATE_RE.match(date_str):
+        return date_str[:10]
     try:
         # Use dateutil.parser to parse the input date string flexibly
         parsed_date = parser.parse(date_str)
@@ -48,46 +57,80 @@ def prepare_date(date_str):
         raise ValueError(f"Unable to parse the date: {date_str}. Error: {e}")
 
 
-def insert_post_into_db(post, content, blog_name="hey"):
-    logging.info(f"in function insert_post_into_db, post: {post.title}")
+def post_row(post, content, blog_name="hey"):
+    """The database row for a feed entry and its scraped content"""
+    return (post.title, prepare_date(post.published), blog_name, post.link, content)
+
+
+def insert_posts_into_db(posts_with_content, blog_name="hey", batch_size=blog_db.BATCH_SIZE):
+    """
+    Upsert (post, content) pairs on a single connection, in batches.
+
+    Returns True if every post was stored.
+    """
+    conn = None
     try:
-        logging.info("about to open DB connection")
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        title = post.title
-        link = post.link
-        published_date = prepare_date(post.published)
-        cursor.execute(
-            "INSERT INTO posts (title, date, blog_name, link, full_text) VALUES (?, ?, ?, ?, ?)",
-            (title, published_date, blog_name, link, content),
-        )
-        conn.commit()
+        conn = blog_db.connect(DB_PATH)
+        rows = (post_row(post, content, blog_name) for post, content in posts_with_content)
+        written = blog_db.upsert_posts(conn, rows, batch_size)
+        logging.info(f"{written} posts written to database")
+        return True
     except sqlite3.Error as e:
-        logging.error(f"Error inserting post into database: {e}")
+        logging.error(f"Error inserting posts into database: {e}")
+        return False
     finally:
         if conn:
             conn.close()
             logging.info(f"Database connection closed")
 
 
-def insert_missing_posts_into_db(dry_run=False):
+def insert_post_into_db(post, content, blog_name="hey"):
+    """Insert one post; returns True if it was stored"""
+    logging.info(f"in function insert_post_into_db, post: {post.title}")
+    return insert_posts_into_db([(post, content)], blog_name)
+
+
+def insert_missing_posts_into_db(
+    dry_run=False, concurrency=DEFAULT_CONCURRENCY, min_host_interval=MIN_HOST_INTERVAL
+):
     if not dry_run:
         missing_posts = get_missing_posts()
         # if there are no missing posts, return
         if len(missing_posts) == 0:
             logging.info("No missing posts found")
+            save_feed_state()
             return
         logging.info(f"Found {len(missing_posts)} missing posts")
-        for post in missing_posts:
-            logging.info(f"Fetching content for post: {post.title}")
-            content = fetch_blog_content(post.link)
-            logging.info(f"Inserting post into database: {post.title}")
-            insert_post_into_db(post, content)
-            logging.info(f"Post inserted into database: {post.title}")
+        # Fetch concurrently, writing posts in batches as their content arrives
+        posts_by_link = {post.link: post for post in missing_posts}
+        fetched = (
+            (posts_by_link[link], content)
+            for link, content in fetch_blog_contents(
+                posts_by_link, concurrency=concurrency, min_host_interval=min_host_interval
+            )
+        )
+        # Only remember the feed as seen if every new post made it in
+        if insert_posts_into_db(fetched):
+            save_feed_state()
     else:
         logging.info("Dry run: Would insert post into database")
 
 
 if __name__ == "__main__":
-    # Run in dry run mode
-    insert_missing_posts_into_db(dry_run=False)
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"number of posts to fetch in parallel (default: {DEFAULT_CONCURRENCY})",
+    )
+    arg_parser.add_argument(
+        "--min-host-interval",
+        type=float,
+        default=MIN_HOST_INTERVAL,
+        help=f"average seconds between requests to one host (default: {MIN_HOST_INTERVAL})",
+    )
+    args = arg_parser.parse_args()
+    insert_missing_posts_into_db(
+        dry_run=False, concurrency=args.concurrency, min_host_interval=args.min_host_interval
+    )
@@ -1,36 +1,282 @@
 """
-- given a hey url, fetch the blog content
+- given a hey url, fetch the blog content (download_page + extract_blog_content)
+- given many hey urls, fetch them concurrently with per-host rate limiting
+- pages are fetched over a shared keep-alive session and cached on disk;
+  re-fetches send conditional requests, so unchanged pages cost a 304
 """
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+import hashlib
+import json
 import logging  # Import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+try:
+    import lxml  # noqa: F401 - only needed as a BeautifulSoup tree builder
+except ImportError:
+    lxml = None
 
 # Set up logging configuration
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+REQUEST_TIMEOUT = 20  # seconds, for connect and for each read
+MAX_RETRIES = 3  # retries after the first attempt, for timeouts, 429s and 5xxs
+BACKOFF_SECONDS = 1.0  # first retry delay, doubled on each further retry
+DEFAULT_CONCURRENCY = 4  # parallel fetches
+MIN_HOST_INTERVAL = 0.1  # average seconds between requests to the same host
+
+NOT_FOUND_CONTENT = "<div>Blog content not found.</div>"
+
+# How extract_blog_content parses a page:
+# - "lxml": lxml's C parser, only building the trix-content subtree
+# - "strainer": html.parser, only building the trix-content subtree
+# - "soup": html.parser, building the whole page (the original behaviour)
+EXTRACTION_ENGINES = ("lxml", "strainer", "soup")
+DEFAULT_EXTRACTION_ENGINE = "lxml" if lxml else "soup"
+
+
+def _is_trix_content(class_value):
+    # The strainer sees the raw attribute, e.g. "trix-content lead", so
+    # match on its words the way soup.find(class_=...) does
+    if not class_value:
+        return False
+    words = class_value.split() if isinstance(class_value, str) else class_value
+    return "trix-content" in words
+
+
+TRIX_CONTENT = SoupStrainer("div", class_=_is_trix_content)
+
+# Get the base directory of the script
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Path to the on-disk HTTP cache
+HTTP_CACHE_DIR = os.path.join(BASE_DIR, "../data/http_cache")
+
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def get_session(concurrency=DEFAULT_CONCURRENCY):
+    """
+    The shared keep-alive session, with a connection pool for at least
+    concurrency parallel fetches. A larger concurrency than the session
+    was made for mounts a bigger pool, so connections are not discarded.
+    """
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if concurrency > _session_pool_size:
+            _session_pool_size = concurrency
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=concurrency, pool_maxsize=concurrency * 2
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+class HttpCache:
+    """On-disk cache of page bodies keyed by URL, with their validators.
+
+    Each URL is stored as <sha256>.json (url, ETag, Last-Modified) plus
+    <sha256>.body. Only responses carrying a validator are stored, since
+    nothing else can be revalidated.
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, url, suffix):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def _load_meta(self, url):
+        try:
+            with open(self._path(url, ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since headers for a cached URL"""
+        meta = self._load_meta(url)
+        if not meta or not os.path.exists(self._path(url, ".body")):
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, url):
+        """The cached body of a URL, or None"""
+        try:
+            with open(self._path(url, ".body"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def store(self, url, response):
+        """Cache a 200 response if it has a validator"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified}
+        # Write to temporary files and rename, as other threads may be reading
+        for suffix, text in ((".body", response.text), (".json", json.dumps(meta))):
+            path = self._path(url, suffix)
+            with open(f"{path}.{threading.get_ident()}.tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(f"{path}.{threading.get_ident()}.tmp", path)
+
+
+default_cache = HttpCache()
 
-def fetch_blog_content(url):
-    try:
-        # Fetch the HTML content
-        response = requests.get(url)
-        response.raise_for_status()  # Check for request errors
 
-        # Parse the HTML
-        soup = BeautifulSoup(response.text, "html.parser")
+class HostRateLimiter:
+    """Limit requests to each host to one per min_interval seconds on average.
 
-        # Extract the blog post content inside <div class="trix-content">
-        content_div = soup.find("div", class_="trix-content")
-        if content_div:
+    A token bucket: up to burst requests may go at once (so a pool of
+    fetchers all start immediately), after which they are spaced out to
+    the sustained rate. Safe to share between threads.
+    """
+
+    def __init__(self, min_interval=MIN_HOST_INTERVAL, burst=1):
+        self.min_interval = min_interval
+        self.burst = max(1, burst)
+        self.lock = threading.Lock()
+        self.next_slot = {}  # host -> when its bucket is next empty at the sustained rate
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            due = max(now, self.next_slot.get(host, now))
+            # Go as soon as fewer than burst requests are ahead of the sustained rate
+            slot = max(now, due - (self.burst - 1) * self.min_interval)
+            self.next_slot[host] = due + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before retry number attempt (0-based)"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return BACKOFF_SECONDS * 2**attempt
+
+
+def download_page(
+    url, timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES, rate_limiter=None, cache=default_cache
+):
+    """
+    Fetch the HTML of a page, retrying transient failures with backoff.
+
+    Raises:
+        requests.exceptions.RequestException: If the page could not be fetched.
+    """
+    session = get_session()
+    headers = cache.conditional_headers(url) if cache else {}
+    for attempt in range(retries + 1):
+        if rate_limiter:
+            rate_limiter.wait(url)
+        response = None
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+            if response.status_code != 429 and response.status_code < 500:
+                break
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == retries:
+                raise
+        if attempt < retries:
+            delay = _retry_delay(response, attempt)
+            logging.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+    response.raise_for_status()  # Check for request errors
+
+    html = cache.load(url) if cache and response.status_code == 304 else None
+    if html is None:
+        html = response.text
+        if cache and response.status_code == 200:
+            cache.store(url, response)
+    else:
+        logging.info(f"Not modified, using cached copy of {url}")
+    return html
+
+
+def extract_blog_content(html, engine=DEFAULT_EXTRACTION_ENGINE):
+    """The <div class="trix-content"> of a page, or a not-found placeholder"""
+    # Parse the HTML; the strained engines skip everything outside the content
+    if engine == "lxml":
+        soup = BeautifulSoup(html, "lxml", parse_only=TRIX_CONTENT)
+    elif engine == "strainer":
+        soup = BeautifulSoup(html, "html.parser", parse_only=TRIX_CONTENT)
+    else:
+        soup = BeautifulSoup(html, "html.parser")
+
+    # Extract the blog post content inside <div class="trix-content">
+    content_div = soup.find("div", class_="trix-content")
+    if content_div:
+        return str(content_div)  # Return the full HTML of the content_div
+    else:
+        return NOT_FOUND_CONTENT
+
+
+def fetch_error_content(error):
+    """The HTML stored in place of a post's content when fetching fails"""
+    return f"<div>Error fetching the URL: {error}</div>"
+
+
+def fetch_blog_content(
+    url, timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES, rate_limiter=None, cache=default_cache
+):
+    try:
+        html = download_page(url, timeout, retries, rate_limiter, cache)
+        content = extract_blog_content(html)
+        if content != NOT_FOUND_CONTENT:
             logging.info(f"Content found for {url}")
-            return str(content_div)  # Return the full HTML of the content_div
-        else:
-            return "<div>Blog content not found.</div>"
+        return content
     except requests.exceptions.RequestException as e:
         logging.error(f"Error fetching the URL: {e}")
-        return f"<div>Error fetching the URL: {e}</div>"
+        return fetch_error_content(e)
+
+
+def fetch_blog_contents(
+    urls,
+    concurrency=DEFAULT_CONCURRENCY,
+    timeout=REQUEST_TIMEOUT,
+    retries=MAX_RETRIES,
+    min_host_interval=MIN_HOST_INTERVAL,
+    cache=default_cache,
+):
+    """
+    Fetch the blog content of many urls on a bounded thread pool.
+
+    Yields (url, content) pairs as each fetch completes, so callers can
+    store results while the rest are still downloading. Failures yield the
+    same error HTML as fetch_blog_content.
+    """
+    rate_limiter = HostRateLimiter(min_host_interval, burst=concurrency)
+    get_session(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(fetch_blog_content, url, timeout, retries, rate_limiter, cache): url
+            for url in urls
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+"""
+Static search index for the archive page.
+
+build_search_index() writes an inverted index over every post's title and
+text into a directory next to the archive, for searching on GitHub Pages
+without a server:
+
+    search/manifest.json    shard names, document count
+    search/docs.json        [title, date, blog_name, link] per document id
+    search/shards/<p>.json  {term: postings} for terms starting with <p>
+
+Postings are flat [id, weight, id, weight, ...] lists with ids
+delta-encoded, so they are small and compress well under gzip. Ids follow
+insertion order, so a new post is appended to docs.json and only changes
+the shards of its own terms. The weight
+is how often the term appears, with title occurrences counting
+TITLE_WEIGHT times. SEARCH_SCRIPT is the matching loader: it fetches
+docs.json and only the shards a query needs, on first use.
+"""
+
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import defaultdict
+
+import blog_db
+from atomic_write import write_atomic
+
+INDEX_VERSION = 2
+PREFIX_LENGTH = 2  # characters of a term that choose its shard
+TITLE_WEIGHT = 10
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 30
+
+STOPWORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "be", "but", "by", "for",
+    "from", "has", "have", "in", "is", "it", "its", "of", "on", "or", "that",
+    "the", "this", "to", "was", "were", "with",
+}
+
+WORD_RE = re.compile(r"[^\W_]+")
+SHARD_NAME_RE = re.compile(r"^[a-z0-9]+$")
+
+
+def tokenize(text):
+    """Lowercased, accent-folded words; the loader's tokenize() must match"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [
+        word
+        for word in WORD_RE.findall(text)
+        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH and word not in STOPWORDS
+    ]
+
+
+def shard_name(term):
+    """The shard a term lives in; the loader's shardName() must match"""
+    prefix = term[:PREFIX_LENGTH]
+    if SHARD_NAME_RE.match(prefix):
+        return prefix
+    return "x" + prefix.encode("utf-8").hex()
+
+
+def _write_json(path, data):
+    write_atomic(path, [json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True)])
+
+
+def build_search_index(search_dir, db_path=blog_db.DB_PATH):
+    """Write the search index for every post, in insertion order; returns the document count"""
+    conn = blog_db.connect(db_path)
+    docs = []
+    postings = defaultdict(list)  # term -> [(doc id, weight)], in doc id order
+    rows = conn.execute(
+        "SELECT title, date, blog_name, link, full_text FROM posts ORDER BY rowid"
+    )
+    for doc_id, (title, date, blog_name, link, full_text) in enumerate(rows):
+        docs.append([title, date, blog_name, link])
+        weights = defaultdict(int)
+        for term in tokenize(title or ""):
+            weights[term] += TITLE_WEIGHT
+        for term in tokenize(blog_db.strip_html(full_text)):
+            weights[term] += 1
+        for term, weight in weights.items():
+            postings[term].append((doc_id, weight))
+    conn.close()
+
+    shards = defaultdict(dict)
+    for term, entries in postings.items():
+        flat = []
+        previous = 0
+        for doc_id, weight in entries:
+            flat += [doc_id - previous, weight]
+            previous = doc_id
+        shards[shard_name(term)][term] = flat
+
+    # Each file is replaced whole, and the manifest goes last so a reader
+    # never sees it list a shard that is not there yet
+    shard_dir = os.path.join(search_dir, "shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    for name, terms in shards.items():
+        _write_json(os.path.join(shard_dir, name + ".json"), terms)
+    _write_json(os.path.join(search_dir, "docs.json"), docs)
+    _write_json(
+        os.path.join(search_dir, "manifest.json"),
+        {
+            "version": INDEX_VERSION,
+            "prefix_length": PREFIX_LENGTH,
+            "docs": len(docs),
+            "shards": sorted(shards),
+        },
+    )
+    # Remove shards for prefixes that no longer occur, now nothing lists them
+    for filename in os.listdir(shard_dir):
+        if filename.endswith(".json") and filename[:-5] not in shards:
+            os.remove(os.path.join(shard_dir, filename))
+    logging.info(f"Search index written: {len(docs)} posts, {len(postings)} terms, {len(shards)} shards")
+    return len(docs)
+
+
+# Loader for the archive page: needs an input#search-input, whose
+# data-index attribute is the index's URL, and an ol#search-results.
+# Every word must match; the last one may be a prefix of at least
+# PREFIX_LENGTH characters.
+SEARCH_SCRIPT = """
+    <script>
+    (function () {
+        const input = document.getElementById('search-input');
+        const results = document.getElementById('search-results');
+        const SEARCH_URL = input.dataset.index || 'search/';
+        const PREFIX_LENGTH = %(prefix_length)d;
+        const MIN_TERM_LENGTH = %(min_term_length)d;
+        const MAX_TERM_LENGTH = %(max_term_length)d;
+        const STOPWORDS = new Set(%(stopwords)s);
+        const shards = {};
+        let manifest = null;
+        let docs = null;
+        let latest = 0;
+
+        function fetchJson(path) {
+            return fetch(SEARCH_URL + path).then(response => {
+                if (!response.ok) throw new Error(path + ': ' + response.status);
+                return response.json();
+            });
+        }
+
+        function tokenize(text) {
+            const words = text.toLowerCase().normalize('NFKD').replace(/\\p{M}/gu, '').match(/[\\p{L}\\p{N}]+/gu) || [];
+            return words.filter(word => {
+                const length = Array.from(word).length;
+                return length >= MIN_TERM_LENGTH && length <= MAX_TERM_LENGTH && !STOPWORDS.has(word);
+            });
+        }
+
+        function shardName(term) {
+            const prefix = Array.from(term).slice(0, PREFIX_LENGTH).join('');
+            if (/^[a-z0-9]+$/.test(prefix)) return prefix;
+            return 'x' + Array.from(new TextEncoder().encode(prefix), b => b.toString(16).padStart(2, '0')).join('');
+        }
+
+        function loadShard(name) {
+            if (!manifest.shards.includes(name)) return Promise.resolve({});
+            if (!shards[name]) shards[name] = fetchJson('shards/' + name + '.json');
+            return shards[name];
+        }
+
+        function decode(flat) {
+            const weights = new Map();
+            let doc = 0;
+            for (let i = 0; i < flat.length; i += 2) {
+                doc += flat[i];
+                weights.set(doc, flat[i + 1]);
+            }
+            return weights;
+        }
+
+        // Weights per document for a term, or for every term it prefixes
+        function lookup(shard, term, prefix) {
+            if (!prefix) return decode(shard[term] || []);
+            const merged = new Map();
+            for (const key in shard) {
+                if (!key.startsWith(term)) continue;
+                for (const [doc, weight] of decode(shard[key])) {
+                    merged.set(doc, Math.max(weight, merged.get(doc) || 0));
+                }
+            }
+            return merged;
+        }
+
+        async function search(query) {
+            if (!manifest) [manifest, docs] = await Promise.all([fetchJson('manifest.json'), fetchJson('docs.json')]);
+            const terms = tokenize(query);
+            if (!terms.length) return [];
+            const last = terms.length - 1;
+            const matches = await Promise.all(terms.map(async (term, i) => {
+                const prefix = i === last && /[\\p{L}\\p{N}]$/u.test(query) && Array.from(term).length >= PREFIX_LENGTH;
+                return lookup(await loadShard(shardName(term)), term, prefix);
+            }));
+            const scores = new Map();
+            for (const [doc] of matches[0]) {
+                if (matches.every(match => match.has(doc))) {
+                    scores.set(doc, matches.reduce((sum, match) =>
+                        sum + match.get(doc) * Math.log(1 + docs.length / match.size), 0));
+                }
+            }
+            // Best first; equal scores newest first (ids are in insertion order)
+            return Array.from(scores)
+                .sort((a, b) => b[1] - a[1] || docs[b[0]][1].localeCompare(docs[a[0]][1]) || b[0] - a[0])
+                .slice(0, 50).map(([doc]) => docs[doc]);
+        }
+
+        function render(found, query) {
+            results.replaceChildren();
+            if (!query.trim()) return;
+            if (!found.length) {
+                const empty = document.createElement('li');
+                empty.className = 'post-item';
+                empty.textContent = 'No posts found.';
+                results.appendChild(empty);
+                return;
+            }
+            for (const [title, date, blogName, link] of found) {
+                const item = document.createElement('li');
+                item.className = 'post-item';
+                const dateSpan = document.createElement('span');
+                dateSpan.className = 'post-date';
+                dateSpan.textContent = date;
+                const anchor = document.createElement('a');
+                anchor.className = 'post-title';
+                anchor.href = link;
+                anchor.textContent = title;
+                const blogSpan = document.createElement('span');
+                blogSpan.className = 'post-blog';
+                blogSpan.textContent = '— ' + blogName;
+                item.append(dateSpan, ' ', anchor, ' ', blogSpan);
+                results.appendChild(item);
+            }
+        }
+
+        input.addEventListener('input', () => {
+            const query = input.value;
+            const request = ++latest;
+            search(query).then(found => {
+                if (request === latest) render(found, query);
+            }).catch(error => console.error('Search failed:', error));
+        });
+    })();
+    </script>
+""" % {
+    "prefix_length": PREFIX_LENGTH,
+    "min_term_length": MIN_TERM_LENGTH,
+    "max_term_length": MAX_TERM_LENGTH,
+    "stopwords": json.dumps(sorted(STOPWORDS)),
+}
@@ -0,0 +1,46 @@
+"""
+Search blog_posts.db from the command line.
+
+    python scripts/search_posts.py open science
+    python scripts/search_posts.py --raw '"peer review" OR preprint*'
+
+Results are ranked with BM25 (title matches count more than body matches)
+and shown with a snippet of the matching text.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+import blog_db
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("query", nargs="+", help="words to search for")
+    arg_parser.add_argument("--limit", type=int, default=20, help="maximum results (default: 20)")
+    arg_parser.add_argument("--raw", action="store_true", help="treat the query as FTS5 query syntax")
+    arg_parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    arg_parser.add_argument("--db", default=blog_db.DB_PATH, help="database to search")
+    args = arg_parser.parse_args()
+
+    conn = blog_db.connect(args.db)
+    started = time.perf_counter()
+    try:
+        results = blog_db.search_posts(conn, " ".join(args.query), args.limit, args.raw)
+    except sqlite3.OperationalError as e:
+        # A malformed --raw expression, e.g. an unbalanced quote or a bare OR
+        sys.exit(f"invalid query: {e}")
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(f"{result['date']}  {result['title']}")
+            print(f"    {result['link']}")
+            print(f"    {result['snippet']}")
+        print(f"{len(results)} results in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,234 @@
+"""
+Watch the site's sources and rebuild what they feed, with a preview server.
+
+Changes are collected until DEBOUNCE_SECONDS pass without another one (so
+copying in a batch of photos triggers one rebuild), mapped to build_site
+targets and built through its dependency graph:
+
+    images/<gallery>/<photo>    -> gallery:<gallery> (after its derivatives)
+                                   and master-gallery
+    images/gallery-config.md    -> every gallery page and master-gallery
+    images/*.py                 -> every gallery target
+    data/blog_posts.db          -> archive
+
+generate_resized_images.py keeps a manifest per gallery, so only photos
+that are new or changed are resized. Filesystem events come from watchdog
+(inotify on Linux) when it is installed, otherwise the sources are polled.
+
+    python scripts/watch_site.py              # serves http://localhost:8000/
+    python scripts/watch_site.py --port 8080 --no-serve
+"""
+
+import argparse
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import build_site
+from build_site import DB_PATH, DEFAULT_JOBS, GALLERY_CONFIG, IMAGES_DIR, ROOT_DIR
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+DEBOUNCE_SECONDS = 1.0  # quiet time after the last change before rebuilding
+POLL_INTERVAL = 1.0  # seconds between scans when watchdog is not installed
+DEFAULT_PORT = 8000
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif"}
+
+# watchdog events that change a file; it also reports opens and closes,
+# which every build makes by reading its sources
+CHANGE_EVENTS = {"created", "modified", "deleted", "moved"}
+
+
+def targets_for_path(path, targets):
+    """The build targets a changed file feeds (empty for files nothing reads)"""
+    path = os.path.abspath(path)
+    galleries = [name for name in targets if name.startswith("gallery:")]
+    if path in (DB_PATH, DB_PATH + "-wal"):
+        return {"archive"}
+    if path == GALLERY_CONFIG:
+        return set(galleries) | {"master-gallery"}
+    relative = os.path.relpath(path, IMAGES_DIR)
+    parts = relative.split(os.sep)
+    if relative.startswith(os.pardir):
+        return set()
+    if len(parts) == 1 and path.endswith(".py"):
+        return set(galleries) | {"master-gallery"}
+    # Only photos directly in a gallery; thumbs/, medium/ and w<width>/
+    # are outputs, as are the page and the dotfile caches
+    if len(parts) == 2 and os.path.splitext(parts[1])[1].lower() in IMAGE_EXTENSIONS:
+        name = f"gallery:{parts[0]}"
+        if name in targets:
+            return {name, "master-gallery"}
+    return set()
+
+
+class PollingWatcher:
+    """Stand-in for a watchdog observer: scans the sources for changes"""
+
+    def __init__(self, changes, interval=POLL_INTERVAL):
+        self.changes = changes
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="poll", daemon=True)
+
+    def _scan(self):
+        paths = [GALLERY_CONFIG, DB_PATH, DB_PATH + "-wal"]
+        for entry in os.scandir(IMAGES_DIR):
+            if entry.is_file() and entry.name.endswith(".py"):
+                paths.append(entry.path)
+            elif entry.is_dir() and not entry.name.startswith("."):
+                paths.extend(
+                    photo.path
+                    for photo in os.scandir(entry.path)
+                    if photo.is_file() and os.path.splitext(photo.name)[1].lower() in IMAGE_EXTENSIONS
+                )
+        snapshot = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _run(self):
+        previous = self._scan()
+        while not self.stop_event.wait(self.interval):
+            current = self._scan()
+            for path in previous.keys() | current.keys():
+                if previous.get(path) != current.get(path):
+                    self.changes.put(path)
+            previous = current
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self):
+        self.thread.join()
+
+
+def start_watcher(changes):
+    """Put the path of every changed source on the changes queue"""
+    if Observer is None:
+        logging.info(f"watchdog is not installed, polling every {POLL_INTERVAL}s")
+        watcher = PollingWatcher(changes)
+    else:
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory or event.event_type not in CHANGE_EVENTS:
+                    return
+                changes.put(event.src_path)
+                if getattr(event, "dest_path", None):
+                    changes.put(event.dest_path)
+
+        # data/ only exists once a database has been made; create it so
+        # the first one is seen
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        watcher = Observer()
+        watcher.schedule(Handler(), IMAGES_DIR, recursive=True)
+        watcher.schedule(Handler(), os.path.dirname(DB_PATH), recursive=False)
+    watcher.start()
+    return watcher
+
+
+def next_batch(changes, debounce=DEBOUNCE_SECONDS):
+    """Block for a change, then collect more until debounce seconds pass quietly"""
+    paths = {changes.get()}
+    while True:
+        try:
+            paths.add(changes.get(timeout=debounce))
+        except queue.Empty:
+            return paths
+
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    """Serves the site, logging requests at debug level to keep build output readable"""
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+def start_preview_server(port=DEFAULT_PORT):
+    handler = functools.partial(PreviewHandler, directory=ROOT_DIR)
+    try:
+        server = ThreadingHTTPServer(("localhost", port), handler)
+    except OSError as e:
+        raise SystemExit(f"Can't serve the preview on port {port}: {e}")
+    threading.Thread(target=server.serve_forever, name="preview", daemon=True).start()
+    logging.info(f"Serving the site at http://localhost:{port}/")
+    return server
+
+
+def rebuild(names, jobs=DEFAULT_JOBS):
+    """Build the named targets, re-reading the graph in case the config changed"""
+    targets = build_site.build_graph(jobs)
+    names = [name for name in names if name in targets]
+    if not names:
+        return
+    started = time.perf_counter()
+    results = build_site.build(targets, names, jobs)
+    # Stay quiet when the change turned out not to matter
+    if any(status not in ("up to date", "no sources") for status, _ in results.values()):
+        build_site.print_timings(results, time.perf_counter() - started)
+
+
+def watch(jobs=DEFAULT_JOBS, debounce=DEBOUNCE_SECONDS, port=DEFAULT_PORT, serve=True):
+    """Build everything once, then rebuild affected targets on each change until interrupted"""
+    changes = queue.Queue()
+    watcher = start_watcher(changes)
+    server = None
+    try:
+        if serve:
+            server = start_preview_server(port)
+        rebuild(list(build_site.build_graph(jobs)), jobs)
+        logging.info("Watching for changes (Ctrl-C to stop)")
+        while True:
+            paths = next_batch(changes, debounce)
+            targets = build_site.build_graph(jobs)
+            names = set()
+            for path in paths:
+                names |= targets_for_path(path, targets)
+            if names:
+                logging.info(f"{len(paths)} changed file(s), rebuilding {', '.join(sorted(names))}")
+                rebuild(sorted(names), jobs)
+    except KeyboardInterrupt:
+        logging.info("Stopping")
+    finally:
+        watcher.stop()
+        watcher.join()
+        if server:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument(
+        "-j", "--jobs", type=int, default=DEFAULT_JOBS,
+        help=f"targets to run at once (default: {DEFAULT_JOBS})",
+    )
+    arg_parser.add_argument(
+        "--debounce", type=float, default=DEBOUNCE_SECONDS,
+        help=f"seconds without changes before rebuilding (default: {DEBOUNCE_SECONDS})",
+    )
+    arg_parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT,
+        help=f"preview server port (default: {DEFAULT_PORT})",
+    )
+    arg_parser.add_argument("--no-serve", action="store_true", help="don't start the preview server")
+    args = arg_parser.parse_args()
+    if args.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+    watch(args.jobs, args.debounce, args.port, serve=not args.no_serve)